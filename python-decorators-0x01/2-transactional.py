@@ -1,10 +1,138 @@
 import sqlite3
 import functools
 import os
+import re
+from contextlib import contextmanager
 
 # Define the database file path
 DB_FILE = 'users.db'
 
+# Callables notified with the set of tables written by each committed transaction
+_write_listeners = []
+
+# Table names may be quoted "like this", [like this] or `like this`, and schema-qualified
+TABLE_NAME_PATTERN = r'((?:"[^"]+"|\[[^\]]+\]|`[^`]+`|[\w$]+)(?:\.(?:"[^"]+"|\[[^\]]+\]|`[^`]+`|[\w$]+))?)'
+_WRITE_STATEMENT = re.compile(
+    r'^\s*(?:INSERT(?:\s+OR\s+\w+)?\s+INTO|REPLACE\s+INTO|UPDATE(?:\s+OR\s+\w+)?|DELETE\s+FROM'
+    r'|DROP\s+TABLE(?:\s+IF\s+EXISTS)?|ALTER\s+TABLE|CREATE\s+(?:TEMP(?:ORARY)?\s+)?TABLE'
+    r'(?:\s+IF\s+NOT\s+EXISTS)?|TRUNCATE(?:\s+TABLE)?)\s+' + TABLE_NAME_PATTERN,
+    re.IGNORECASE
+)
+# sqlite traces each statement a trigger runs as "-- TRIGGER name", without its SQL
+_TRIGGER_TRACE = re.compile(r'\s*--\s*TRIGGER\b', re.IGNORECASE)
+_READ_ONLY_KEYWORDS = ('SELECT', 'PRAGMA', 'EXPLAIN', 'VALUES', 'BEGIN', 'COMMIT', 'END',
+                       'ROLLBACK', 'SAVEPOINT', 'RELEASE', 'ANALYZE')
+
+def normalize_table(name):
+    """Strips quoting and lower-cases a table name, dropping any schema prefix."""
+    name = name.split('.')[-1]
+    return name.strip('"[]`').lower()
+
+def is_write(sql):
+    """Whether an SQL statement may modify data (anything but a plain read)."""
+    match = re.match(r'\s*(\w+)', sql or '')
+    if not match:
+        return False
+    keyword = match.group(1).upper()
+    if keyword == 'WITH':
+        # A CTE can front an INSERT/UPDATE/DELETE as well as a SELECT
+        return re.search(r'\b(INSERT|UPDATE|DELETE|REPLACE)\b', sql, re.IGNORECASE) is not None
+    return keyword not in _READ_ONLY_KEYWORDS
+
+def tables_written(sql):
+    """
+    Returns the set of tables a write statement modifies.
+    '*' stands for "unknown", for write statements the parser does not understand
+    and for traced trigger bodies, which may write any table.
+    """
+    if _TRIGGER_TRACE.match(sql or ''):
+        return {'*'}
+    if not is_write(sql):
+        return set()
+    match = _WRITE_STATEMENT.match(sql)
+    if match is None:
+        return {'*'}
+    return {normalize_table(match.group(1))}
+
+def implied_writes(conn, tables):
+    """
+    Returns the tables written on sqlite's own account when tables change:
+    by the triggers defined on them (recursively) and by foreign key actions
+    (ON DELETE/ON UPDATE CASCADE, SET NULL, SET DEFAULT) when foreign keys are on.
+    Statements run by triggers are not reliably traced, and foreign key actions
+    never are. {'*'} if the schema cannot be read.
+    """
+    if not tables or '*' in tables:
+        return set()
+    try:
+        triggers = conn.execute(
+            "SELECT tbl_name, sql FROM sqlite_master WHERE type = 'trigger' "
+            "UNION ALL SELECT tbl_name, sql FROM sqlite_temp_master WHERE type = 'trigger'"
+        ).fetchall()
+        references = []
+        if conn.execute("PRAGMA foreign_keys").fetchone()[0]:
+            references = conn.execute(
+                "SELECT m.name, f.\"table\", f.on_update, f.on_delete FROM sqlite_master AS m "
+                "JOIN pragma_foreign_key_list(m.name) AS f WHERE m.type = 'table'"
+            ).fetchall()
+    except sqlite3.Error:
+        return {'*'}
+    implied = set()
+    pending = set(tables)
+    while pending:
+        table = pending.pop()
+        targets = set()
+        for owner, sql in triggers:
+            if normalize_table(owner) == table:
+                body = re.split(r'\bBEGIN\b', sql, maxsplit=1, flags=re.IGNORECASE)[-1]
+                body = re.sub(r'\bEND\s*;?\s*$', '', body, flags=re.IGNORECASE)
+                for statement in body.split(';'):
+                    targets |= tables_written(statement)
+        for child, parent, on_update, on_delete in references:
+            if (normalize_table(parent) == table
+                    and {on_update, on_delete} - {'NO ACTION', 'RESTRICT'}):
+                targets.add(normalize_table(child))
+        if '*' in targets:
+            return {'*'}
+        pending |= targets - implied - set(tables)
+        implied |= targets
+    return implied - set(tables)
+
+@contextmanager
+def track_writes(conn):
+    """
+    Context manager yielding the set of tables written by the statements run on
+    conn inside the block, including tables written by triggers and foreign key actions.
+    It owns the connection's trace hook while the block runs.
+    """
+    written = set()
+    conn.set_trace_callback(lambda statement: written.update(tables_written(statement)))
+    try:
+        yield written
+    finally:
+        conn.set_trace_callback(None)
+    written |= implied_writes(conn, written)
+
+def register_write_listener(listener):
+    """
+    Registers listener(tables) to be called after every transaction committed by
+    @transactional, with the set of tables its statements wrote.
+    """
+    if listener not in _write_listeners:
+        _write_listeners.append(listener)
+    return listener
+
+def unregister_write_listener(listener):
+    if listener in _write_listeners:
+        _write_listeners.remove(listener)
+
+def _notify_write_listeners(tables):
+    for listener in list(_write_listeners):
+        try:
+            listener(tables)
+        except Exception as e:
+            print(f"Write listener {listener!r} failed: {e}")
+
 # --- Helper function to set up the database for testing ---
 def setup_database(db_file):
     """
@@ -73,6 +201,12 @@ def transactional(func):
     A decorator that wraps a function running a database operation inside a transaction.
     If the function raises an error, it rolls back; otherwise, it commits the transaction.
     Assumes the decorated function receives a 'conn' object as its first argument.
+
+    If a transaction is already open on conn (e.g. an outer @transactional call),
+    the function simply runs inside it and the outermost wrapper commits or rolls
+    back. While it owns a transaction the decorator also owns the connection's
+    trace hook: a callback installed with conn.set_trace_callback() is replaced
+    for the duration and must be installed again afterwards.
     """
     @functools.wraps(func)
     def wrapper(*args, **kwargs):
@@ -86,24 +220,33 @@ def transactional(func):
             # For this task, we assume it's used with @with_db_connection.
             raise TypeError("Transactional decorator expects 'conn' as the first argument.")
 
+        if conn.in_transaction:
+            # Nested call: the enclosing transaction commits, rolls back and tracks writes
+            return func(*args, **kwargs)
+
+        # Every statement the connection runs is traced, so the tables written
+        # can be announced to write listeners (e.g. the query cache) after commit
+        isolation_level = conn.isolation_level
         try:
-            # Ensure autocommit is off for explicit transaction management
-            conn.isolation_level = None # This sets the connection to manual commit mode
-            cursor = conn.cursor() # Get a cursor if needed by the decorated function
+            with track_writes(conn) as written:
+                # Ensure autocommit is off for explicit transaction management
+                conn.isolation_level = None # This sets the connection to manual commit mode
+                conn.execute("BEGIN") # Without it every statement would commit on its own
+                cursor = conn.cursor() # Get a cursor if needed by the decorated function
 
-            result = func(*args, **kwargs) # Execute the decorated function
-            conn.commit()
-            print(f"Transaction committed for {func.__name__}.")
-            return result
+                result = func(*args, **kwargs) # Execute the decorated function
+                conn.commit()
+                print(f"Transaction committed for {func.__name__}.")
         except Exception as e:
             if conn:
                 conn.rollback()
                 print(f"Transaction rolled back for {func.__name__} due to error: {e}")
             raise # Re-raise the exception after rollback
         finally:
-            # Reset isolation level to default (or whatever is appropriate for your app)
-            # Or simply let with_db_connection close the connection
-            pass
+            conn.isolation_level = isolation_level
+        if written:
+            _notify_write_listeners(written)
+        return result
 
     return wrapper
 
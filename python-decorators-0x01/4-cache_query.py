@@ -2,12 +2,17 @@ import time
 import sqlite3
 import functools
 import os
+import re
+import sys
+import threading
+from collections import OrderedDict
 
 # Define the database file path
 DB_FILE = 'users.db'
 
-# Global dictionary to store cached query results
-query_cache = {}
+# Task 2 module: its @transactional announces the tables each committed transaction wrote
+_transactional = __import__('2-transactional')
+transactional = _transactional.transactional
 
 # --- Helper function to set up the database for testing ---
 def setup_database(db_file):
@@ -68,28 +73,354 @@ def with_db_connection(func):
                 conn.close()
     return wrapper
 
+#### Cache backends
+def estimate_size(value):
+    """
+    Rough memory footprint of a cached result in bytes.
+    Follows lists, tuples and dicts (e.g. a list of row tuples) one level at a time.
+    """
+    size = sys.getsizeof(value)
+    if isinstance(value, dict):
+        size += sum(estimate_size(k) + estimate_size(v) for k, v in value.items())
+    elif isinstance(value, (list, tuple, set, frozenset)):
+        size += sum(estimate_size(item) for item in value)
+    return size
+
+class LRUCache:
+    """
+    An in-process least-recently-used cache with optional limits:
+    max_entries, max_bytes (as measured by estimate_size) and a default
+    per-entry ttl in seconds. All operations are guarded by one lock.
+    Entries can carry tags (the tables a query read) and be dropped by tag.
+    Counts hits, misses, evictions (entries dropped to respect the limits),
+    expirations (entries dropped because their ttl ran out), invalidations
+    (entries dropped by invalidate_tags) and oversized (values not stored
+    because they alone exceed max_bytes).
+    """
+
+    def __init__(self, max_entries=1024, max_bytes=None, ttl=None, sizeof=estimate_size,
+                 clock=time.monotonic):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.sizeof = sizeof
+        self.clock = clock
+        self.lock = threading.Lock()
+        self.entries = OrderedDict() # key -> (value, expires_at, size, tags); oldest first
+        self.tagged = {} # tag -> set of keys carrying it
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.invalidations = 0
+        self.oversized = 0
+
+    def _drop(self, key):
+        _, _, size, tags = self.entries.pop(key)
+        self.bytes -= size
+        for tag in tags:
+            keys = self.tagged[tag]
+            keys.discard(key)
+            if not keys:
+                del self.tagged[tag]
+
+    def get(self, key):
+        """Returns (True, value) on a hit and (False, None) on a miss."""
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None and entry[1] is not None and entry[1] <= self.clock():
+                self._drop(key)
+                self.expirations += 1
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return False, None
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return True, entry[0]
+
+    def set(self, key, value, ttl=None, tags=(), if_valid=None):
+        """
+        Stores value under key, evicting least-recently-used entries as needed.
+        tags (e.g. the tables the query read) let invalidate_tags() drop it later.
+        if_valid, a callable checked while the lock is held, can veto the store;
+        returns whether the value was stored.
+        """
+        ttl = self.ttl if ttl is None else ttl
+        size = self.sizeof(value) if self.max_bytes is not None else 0
+        tags = frozenset(tags)
+        with self.lock:
+            if if_valid is not None and not if_valid():
+                return False
+            if key in self.entries:
+                self._drop(key)
+            if self.max_bytes is not None and size > self.max_bytes:
+                self.oversized += 1
+                return False # Larger than the whole cache; caching it would only flush everything else
+            expires_at = self.clock() + ttl if ttl is not None else None
+            self.entries[key] = (value, expires_at, size, tags)
+            self.bytes += size
+            for tag in tags:
+                self.tagged.setdefault(tag, set()).add(key)
+            while (len(self.entries) > self.max_entries
+                   or (self.max_bytes is not None and self.bytes > self.max_bytes)):
+                self._drop(next(iter(self.entries)))
+                self.evictions += 1
+            return True
+
+    def delete(self, key):
+        with self.lock:
+            if key in self.entries:
+                self._drop(key)
+
+    def invalidate_tags(self, tags):
+        """Drops every entry carrying any of tags; returns how many were dropped."""
+        with self.lock:
+            keys = set()
+            for tag in tags:
+                keys.update(self.tagged.get(tag, ()))
+            for key in keys:
+                self._drop(key)
+            self.invalidations += len(keys)
+            return len(keys)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            self.tagged.clear()
+            self.bytes = 0
+
+    def __len__(self):
+        """Number of live entries; expired ones not yet dropped are not counted."""
+        with self.lock:
+            now = self.clock()
+            return sum(1 for _, expires_at, _, _ in self.entries.values()
+                       if expires_at is None or expires_at > now)
+
+    def stats(self):
+        """Returns the hit, miss, eviction, expiration and invalidation counters and current size."""
+        with self.lock:
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'expirations': self.expirations,
+                'invalidations': self.invalidations,
+                'oversized': self.oversized,
+                'entries': len(self.entries),
+                'bytes': self.bytes,
+            }
+
+def _share(total, parts, index):
+    """Part `index` of `total` split into `parts` near-equal integers that add up to it."""
+    return total // parts + (1 if index < total % parts else 0)
+
+class StripedLRUCache:
+    """
+    A thread-safe LRU cache split into independent stripes, each an LRUCache
+    with its own lock and a share of the limits. Threads working on
+    different keys rarely contend for the same lock.
+
+    There are at most max_entries stripes, and the stripes' entry limits add
+    up to exactly max_entries. max_bytes is split the same way and each stripe
+    enforces its own share: a single result larger than max_bytes / stripes is
+    never cached (it is counted as 'oversized' in stats()). Use fewer stripes,
+    or an LRUCache, to cache larger results.
+    """
+
+    def __init__(self, stripes=16, max_entries=1024, max_bytes=None, ttl=None,
+                 sizeof=estimate_size, clock=time.monotonic):
+        stripes = max(1, min(stripes, max_entries))
+        self.stripes = [
+            LRUCache(_share(max_entries, stripes, index),
+                     None if max_bytes is None else max(1, _share(max_bytes, stripes, index)),
+                     ttl, sizeof, clock)
+            for index in range(stripes)
+        ]
+        self.max_item_bytes = None if max_bytes is None else max_bytes // stripes
+
+    def _stripe(self, key):
+        return self.stripes[hash(key) % len(self.stripes)]
+
+    def get(self, key):
+        return self._stripe(key).get(key)
+
+    def set(self, key, value, ttl=None, tags=(), if_valid=None):
+        return self._stripe(key).set(key, value, ttl, tags, if_valid)
+
+    def delete(self, key):
+        self._stripe(key).delete(key)
+
+    def invalidate_tags(self, tags):
+        # Entries with a tag can sit in any stripe
+        return sum(stripe.invalidate_tags(tags) for stripe in self.stripes)
+
+    def clear(self):
+        for stripe in self.stripes:
+            stripe.clear()
+
+    def __len__(self):
+        return sum(len(stripe) for stripe in self.stripes)
+
+    def stats(self):
+        totals = {}
+        for stripe in self.stripes:
+            for name, value in stripe.stats().items():
+                totals[name] = totals.get(name, 0) + value
+        return totals
+
+# Default cache shared by every @cache_query function without its own backend
+query_cache = StripedLRUCache(max_entries=1024, max_bytes=64 * 1024 * 1024, ttl=300)
+
+#### Table dependency tracking
+# Backends passed to @cache_query(backend=...); query_cache is always included
+_backends = []
+# Invalidations per table, and of everything ('*'), so a read that raced with
+# a write to its tables is not cached; _write_count counts every write
+_generations = {}
+_write_count = 0
+_generations_lock = threading.Lock()
+
+# FROM/JOIN followed by one table, or a comma-separated list of tables with optional aliases
+_TABLE_SOURCE = re.compile(
+    r'\b(?:FROM|JOIN)\s+(' + _transactional.TABLE_NAME_PATTERN + r'(?:\s+(?:AS\s+)?\w+)?'
+    r'(?:\s*,\s*' + _transactional.TABLE_NAME_PATTERN + r'(?:\s+(?:AS\s+)?\w+)?)*)',
+    re.IGNORECASE
+)
+
+def tables_read(query):
+    """
+    Returns the set of tables a query reads, from its FROM and JOIN clauses.
+    '*' stands for "unknown": such results are invalidated by any write.
+    """
+    tables = set()
+    for match in _TABLE_SOURCE.finditer(query or ''):
+        for source in match.group(1).split(','):
+            tables.add(_transactional.normalize_table(source.split()[0]))
+    return tables or {'*'}
+
+def expand_views(conn, tables):
+    """
+    Replaces the views among tables with the tables their definitions read,
+    recursively, looked up in sqlite_master. A cached read of a view then
+    goes stale, and is invalidated, when one of its base tables is written.
+    """
+    if not isinstance(conn, sqlite3.Connection):
+        return {'*'} # Views cannot be told from tables without the connection
+    expanded = set()
+    pending = list(tables)
+    seen = set()
+    while pending:
+        name = pending.pop()
+        if name in seen:
+            continue
+        seen.add(name)
+        if name == '*':
+            expanded.add(name)
+            continue
+        try:
+            view = conn.execute(
+                "SELECT sql FROM sqlite_master WHERE type = 'view' AND name = ? COLLATE NOCASE "
+                "UNION ALL "
+                "SELECT sql FROM sqlite_temp_master WHERE type = 'view' AND name = ? COLLATE NOCASE",
+                (name, name)
+            ).fetchone()
+        except sqlite3.Error:
+            return {'*'}
+        if view is None:
+            expanded.add(name)
+        else:
+            pending.extend(tables_read(view[0]))
+    return expanded
+
+def _generation(tags):
+    """A token that changes whenever a write could have made a read of tags stale."""
+    with _generations_lock:
+        if '*' in tags:
+            return _write_count
+        return tuple(_generations.get(tag, 0) for tag in sorted(tags)) + (_generations.get('*', 0),)
+
+def invalidate_tables(tables):
+    """
+    Drops cached results that read any of tables, in every cache used by
+    @cache_query. '*' among tables (a write that could not be parsed) drops everything.
+    """
+    global _write_count
+    tables = set(tables)
+    if not tables:
+        return
+    with _generations_lock:
+        _write_count += 1
+        for table in tables:
+            _generations[table] = _generations.get(table, 0) + 1
+    for cache in [query_cache] + _backends:
+        if '*' in tables:
+            cache.clear()
+        else:
+            cache.invalidate_tags(tables | {'*'})
+
+# Writes committed through @transactional invalidate the tables they touched
+_transactional.register_write_listener(invalidate_tables)
+
 #### cache_query decorator
-def cache_query(func):
+def cache_query(func=None, *, backend=None, ttl=None):
     """
     A decorator that caches query results based on the SQL query string
     and its parameters.
     Assumes the decorated function takes 'conn' as the first arg and 'query' as a keyword arg.
+
+    Use it bare (@cache_query) to share the module's query_cache, or with
+    options (@cache_query(backend=LRUCache(max_entries=100), ttl=60)) to pick
+    the cache and override its default time-to-live.
+
+    Each result is tagged with the tables its query reads (views expanded to
+    their base tables), and is dropped as soon as a write to one of them is
+    committed through @transactional or runs through a @cache_query function.
+    Writes made by triggers and foreign key actions count. Write queries are
+    never cached.
     """
+    if func is None:
+        return functools.partial(cache_query, backend=backend, ttl=ttl)
+    if backend is not None and backend not in _backends:
+        _backends.append(backend)
+
     @functools.wraps(func)
     def wrapper(*args, **kwargs):
+        cache = backend if backend is not None else query_cache
         query = kwargs.get('query')
-        params = kwargs.get('params', ()) # Get parameters if any, default to empty tuple
+        params = kwargs.get('params') or () # Get parameters if any, default to empty tuple
+
+        conn = args[0] if args else None
+        if _transactional.is_write(query):
+            if isinstance(conn, sqlite3.Connection) and not conn.in_transaction:
+                # Trace it, so tables written by triggers and foreign key actions count too
+                with _transactional.track_writes(conn) as written:
+                    result = func(*args, **kwargs)
+                invalidate_tables(written)
+            else:
+                # Inside an open transaction, whose owner traces the writes; drop early anyway
+                result = func(*args, **kwargs)
+                invalidate_tables(_transactional.tables_written(query))
+            return result
 
         # Create a unique cache key based on the query and its parameters
         cache_key = (query, tuple(params))
 
-        if cache_key in query_cache:
+        hit, result = cache.get(cache_key)
+        if hit:
             print(f"CACHE HIT for query: '{query}' with params: {params}")
-            return query_cache[cache_key]
+            return result
         else:
             print(f"CACHE MISS for query: '{query}' with params: {params}. Executing query...")
+            tables = expand_views(conn, tables_read(query))
+            generation = _generation(tables)
             result = func(*args, **kwargs) # Execute the original function
-            query_cache[cache_key] = result # Cache the result
+            # Cache the result unless a write raced with the read. The check runs under
+            # the cache's lock: a writer bumps the generation before it invalidates,
+            # so either the check fails or the invalidation drops the stored entry
+            cache.set(cache_key, result, ttl, tables,
+                      if_valid=lambda: _generation(tables) == generation)
             return result
     return wrapper
 
@@ -106,6 +437,15 @@ def fetch_users_with_cache(conn, query, params=None):
         cursor.execute(query)
     return cursor.fetchall()
 
+@with_db_connection
+@transactional
+def update_user_age(conn, user_id, age):
+    """
+    Updates a user's age in a transaction; on commit, cached reads of users are invalidated.
+    """
+    cursor = conn.cursor()
+    cursor.execute("UPDATE users SET age = ? WHERE id = ?", (age, user_id))
+
 #### Main execution block
 if __name__ == "__main__":
     setup_database(DB_FILE)
@@ -138,6 +478,15 @@ if __name__ == "__main__":
         print(user)
     print(f"Cache size: {len(query_cache)}")
 
+    print("\n--- Update a user: invalidates every cached query that reads users ---")
+    update_user_age(user_id=2, age=26)
+    print(f"Cache size: {len(query_cache)}")
+    users_over_25_fresh = fetch_users_with_cache(query="SELECT * FROM users WHERE age > ?", params=(25,))
+    print("Fetched Users (age > 25, after the update, fresh from the database):")
+    for user in users_over_25_fresh:
+        print(user)
+    print(f"Cache stats: {query_cache.stats()}")
+
     # Clear cache for demonstration purposes
     query_cache.clear()
     print("\nCache cleared.")
@@ -0,0 +1,217 @@
+"""
+Unit tests for the cache backends and table-aware invalidation of 4-cache_query.py.
+"""
+import os
+import sqlite3
+import tempfile
+import unittest
+
+cache_module = __import__('4-cache_query')
+LRUCache = cache_module.LRUCache
+StripedLRUCache = cache_module.StripedLRUCache
+tables_read = cache_module.tables_read
+
+
+class FakeClock:
+    """A clock the tests move forward by hand."""
+
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+class TestLRUCache(unittest.TestCase):
+    """Tests eviction, expiry and tagging in LRUCache."""
+
+    def test_hit_and_miss(self):
+        """get returns (True, value) for a stored key and (False, None) otherwise."""
+        cache = LRUCache()
+        cache.set('a', [1, 2])
+        self.assertEqual(cache.get('a'), (True, [1, 2]))
+        self.assertEqual(cache.get('b'), (False, None))
+        self.assertEqual((cache.stats()['hits'], cache.stats()['misses']), (1, 1))
+
+    def test_evicts_least_recently_used(self):
+        """Past max_entries the entry used longest ago is evicted."""
+        cache = LRUCache(max_entries=2)
+        cache.set('a', 1)
+        cache.set('b', 2)
+        cache.get('a')
+        cache.set('c', 3)
+        self.assertEqual(cache.get('b'), (False, None))
+        self.assertEqual(cache.get('a'), (True, 1))
+        self.assertEqual(cache.get('c'), (True, 3))
+        self.assertEqual(cache.stats()['evictions'], 1)
+
+    def test_byte_limit(self):
+        """Entries are evicted to stay under max_bytes; a value over it is not stored."""
+        cache = LRUCache(max_bytes=10, sizeof=len)
+        cache.set('a', 'xxxx')
+        cache.set('b', 'yyyy')
+        cache.set('c', 'zzzz')
+        self.assertEqual(cache.get('a'), (False, None))
+        self.assertEqual(cache.stats()['bytes'], 8)
+        self.assertFalse(cache.set('d', 'w' * 11))
+        self.assertEqual(len(cache), 2)
+        self.assertEqual(cache.stats()['oversized'], 1)
+
+    def test_ttl_expiry(self):
+        """Entries expire after the default ttl or the one passed to set."""
+        clock = FakeClock()
+        cache = LRUCache(ttl=10, clock=clock)
+        cache.set('default', 1)
+        cache.set('short', 2, ttl=1)
+        clock.now = 5
+        self.assertEqual(cache.get('short'), (False, None))
+        self.assertEqual(cache.get('default'), (True, 1))
+        clock.now = 10
+        self.assertEqual(len(cache), 0)
+        self.assertEqual(cache.get('default'), (False, None))
+        self.assertEqual(cache.stats()['expirations'], 2)
+
+    def test_invalidate_tags(self):
+        """invalidate_tags drops exactly the entries carrying one of the tags."""
+        cache = LRUCache()
+        cache.set('users', 1, tags={'users'})
+        cache.set('join', 2, tags={'users', 'orders'})
+        cache.set('orders', 3, tags={'orders'})
+        self.assertEqual(cache.invalidate_tags({'users'}), 2)
+        self.assertEqual(cache.get('orders'), (True, 3))
+        self.assertEqual(cache.get('join'), (False, None))
+        self.assertEqual(cache.tagged, {'orders': {'orders'}})
+
+    def test_if_valid_vetoes_store(self):
+        """set does not store the value when if_valid returns False."""
+        cache = LRUCache()
+        self.assertFalse(cache.set('a', 1, if_valid=lambda: False))
+        self.assertTrue(cache.set('b', 2, if_valid=lambda: True))
+        self.assertEqual(cache.get('a'), (False, None))
+
+
+class TestStripedLRUCache(unittest.TestCase):
+    """Tests how StripedLRUCache splits its limits."""
+
+    def test_limits_add_up(self):
+        """The stripes' limits add up to the cache's limits."""
+        cache = StripedLRUCache(stripes=16, max_entries=100, max_bytes=1000)
+        self.assertEqual(sum(stripe.max_entries for stripe in cache.stripes), 100)
+        self.assertEqual(sum(stripe.max_bytes for stripe in cache.stripes), 1000)
+
+    def test_no_more_stripes_than_entries(self):
+        """A cache with fewer entries than stripes still holds max_entries items."""
+        cache = StripedLRUCache(stripes=16, max_entries=4)
+        self.assertEqual(len(cache.stripes), 4)
+        self.assertTrue(all(stripe.max_entries == 1 for stripe in cache.stripes))
+
+    def test_operations_span_stripes(self):
+        """Tag invalidation, len and stats cover every stripe."""
+        cache = StripedLRUCache(stripes=4, max_entries=100)
+        for index in range(20):
+            cache.set(index, index, tags={'users'} if index % 2 else {'orders'})
+        self.assertEqual(len(cache), 20)
+        self.assertEqual(cache.invalidate_tags({'users'}), 10)
+        self.assertEqual(len(cache), 10)
+        self.assertEqual(cache.stats()['invalidations'], 10)
+        cache.clear()
+        self.assertEqual(len(cache), 0)
+
+
+class TestTablesRead(unittest.TestCase):
+    """Tests tables_read."""
+
+    def test_from_and_join(self):
+        """Tables in FROM lists and JOINs are found, unquoted and lower-cased."""
+        cases = {
+            "SELECT * FROM users": {'users'},
+            "SELECT * FROM \"Users\" WHERE age > ?": {'users'},
+            "SELECT * FROM users u JOIN orders AS o ON o.user_id = u.id": {'users', 'orders'},
+            "SELECT * FROM main.users, [orders] o": {'users', 'orders'},
+            "SELECT * FROM users WHERE id IN (SELECT user_id FROM orders)": {'users', 'orders'},
+        }
+        for query, expected in cases.items():
+            with self.subTest(query=query):
+                self.assertEqual(tables_read(query), expected)
+
+    def test_unknown(self):
+        """A query without a table source may read anything."""
+        self.assertEqual(tables_read("SELECT 1"), {'*'})
+        self.assertEqual(tables_read(None), {'*'})
+
+
+class TestInvalidation(unittest.TestCase):
+    """Tests that cached results are dropped when their tables are written."""
+
+    def setUp(self):
+        self._tmpdir = tempfile.TemporaryDirectory()
+        self.conn = sqlite3.connect(os.path.join(self._tmpdir.name, 'users.db'))
+        self.conn.executescript('''
+            CREATE TABLE users (id INTEGER PRIMARY KEY, name TEXT, age INTEGER);
+            CREATE TABLE orders (id INTEGER PRIMARY KEY, user_id INTEGER);
+            CREATE VIEW adults AS SELECT name FROM users WHERE age >= 18;
+            INSERT INTO users (name, age) VALUES ('Alice', 30), ('Bob', 22);
+        ''')
+        self.cache = LRUCache()
+
+        @cache_module.cache_query(backend=self.cache)
+        def fetch(conn, query, params=None):
+            return conn.execute(query, params or ()).fetchall()
+
+        self.fetch = fetch
+
+    def tearDown(self):
+        cache_module._backends.remove(self.cache)
+        self.conn.close()
+        self._tmpdir.cleanup()
+
+    def test_transactional_write_invalidates(self):
+        """A write committed through @transactional drops the results that read its table."""
+        @cache_module.transactional
+        def birthday(conn):
+            conn.execute("UPDATE users SET age = age + 1 WHERE name = 'Alice'")
+
+        query = "SELECT age FROM users WHERE name = 'Alice'"
+        self.assertEqual(self.fetch(self.conn, query=query), [(30,)])
+        self.fetch(self.conn, query="SELECT * FROM orders")
+        birthday(self.conn)
+        self.assertEqual(self.fetch(self.conn, query=query), [(31,)])
+        self.assertEqual(self.cache.stats()['hits'], 0)
+        self.assertEqual(self.cache.get(("SELECT * FROM orders", ()))[0], True)
+
+    def test_nested_transactional_invalidates_once_committed(self):
+        """Writes made by a nested @transactional call invalidate when the outer one commits."""
+        @cache_module.transactional
+        def add_user(conn, name):
+            conn.execute("INSERT INTO users (name, age) VALUES (?, 40)", (name,))
+
+        @cache_module.transactional
+        def add_users(conn):
+            add_user(conn, 'Carol')
+            add_user(conn, 'Dave')
+
+        query = "SELECT COUNT(*) FROM users"
+        self.assertEqual(self.fetch(self.conn, query=query), [(2,)])
+        add_users(self.conn)
+        self.assertEqual(self.fetch(self.conn, query=query), [(4,)])
+
+    def test_write_query_invalidates(self):
+        """A write run through a @cache_query function is not cached and invalidates."""
+        query = "SELECT name FROM users ORDER BY id"
+        self.fetch(self.conn, query=query)
+        self.fetch(self.conn, query="DELETE FROM users WHERE name = ?", params=('Bob',))
+        self.conn.commit()
+        self.assertEqual(self.fetch(self.conn, query=query), [('Alice',)])
+        self.assertEqual(len(self.cache), 1)
+
+    def test_view_reads_are_tagged_with_base_tables(self):
+        """A cached read of a view is dropped when the view's base table is written."""
+        query = "SELECT * FROM adults ORDER BY name"
+        self.assertEqual(self.fetch(self.conn, query=query), [('Alice',), ('Bob',)])
+        self.fetch(self.conn, query="UPDATE users SET age = 10 WHERE name = 'Bob'")
+        self.conn.commit()
+        self.assertEqual(self.fetch(self.conn, query=query), [('Alice',)])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,172 @@
+"""
+Unit tests for the write tracking and nesting of @transactional in 2-transactional.py.
+"""
+import os
+import sqlite3
+import tempfile
+import unittest
+
+transactional_module = __import__('2-transactional')
+transactional = transactional_module.transactional
+tables_written = transactional_module.tables_written
+
+
+class TestTablesWritten(unittest.TestCase):
+    """Tests tables_written and is_write."""
+
+    def test_write_statements(self):
+        """The target table of each kind of write is found, unquoted and lower-cased."""
+        cases = {
+            "INSERT INTO users (name) VALUES ('a')": {'users'},
+            "INSERT OR REPLACE INTO Users VALUES (1)": {'users'},
+            "REPLACE INTO users VALUES (1)": {'users'},
+            "UPDATE \"Users\" SET age = 1": {'users'},
+            "UPDATE OR IGNORE main.users SET age = 1": {'users'},
+            "DELETE FROM [users] WHERE id = 1": {'users'},
+            "DROP TABLE IF EXISTS `orders`": {'orders'},
+            "CREATE TEMP TABLE IF NOT EXISTS scratch (id)": {'scratch'},
+            "  alter table users add column x": {'users'},
+        }
+        for sql, expected in cases.items():
+            with self.subTest(sql=sql):
+                self.assertEqual(tables_written(sql), expected)
+
+    def test_reads_write_nothing(self):
+        """Reads and transaction control statements write no table."""
+        for sql in ("SELECT * FROM users", "  pragma foreign_keys", "BEGIN", "COMMIT",
+                    "WITH t AS (SELECT 1) SELECT * FROM t", "", None):
+            with self.subTest(sql=sql):
+                self.assertEqual(tables_written(sql), set())
+
+    def test_unknown_writes(self):
+        """Writes the parser does not understand, and trigger traces, may write anything."""
+        for sql in ("WITH t AS (SELECT 1) DELETE FROM users", "VACUUM",
+                    "-- TRIGGER users_audit"):
+            with self.subTest(sql=sql):
+                self.assertEqual(tables_written(sql), {'*'})
+
+
+class DatabaseTestCase(unittest.TestCase):
+    """Runs each test against a fresh users database in a temporary directory."""
+
+    def setUp(self):
+        self._tmpdir = tempfile.TemporaryDirectory()
+        self.db_file = os.path.join(self._tmpdir.name, 'users.db')
+        self.conn = sqlite3.connect(self.db_file)
+        self.conn.executescript('''
+            CREATE TABLE users (id INTEGER PRIMARY KEY, name TEXT, age INTEGER);
+            CREATE TABLE orders (id INTEGER PRIMARY KEY,
+                                 user_id INTEGER REFERENCES users(id) ON DELETE CASCADE);
+            CREATE TABLE audit (user_id INTEGER);
+            INSERT INTO users (name, age) VALUES ('Alice', 30), ('Bob', 22);
+            INSERT INTO orders (user_id) VALUES (1), (2);
+        ''')
+        self.notified = []
+        transactional_module.register_write_listener(self.notified.append)
+
+    def tearDown(self):
+        transactional_module.unregister_write_listener(self.notified.append)
+        self.conn.close()
+        self._tmpdir.cleanup()
+
+    def count(self, table):
+        with sqlite3.connect(self.db_file) as check:
+            return check.execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0]
+
+
+class TestImpliedWrites(DatabaseTestCase):
+    """Tests that writes made by triggers and foreign key actions are tracked."""
+
+    def test_trigger_writes(self):
+        """A trigger's target tables count as written by the statement that fired it."""
+        self.conn.execute('''
+            CREATE TRIGGER users_audit AFTER UPDATE ON users
+            BEGIN INSERT INTO audit VALUES (NEW.id); END
+        ''')
+        self.assertEqual(transactional_module.implied_writes(self.conn, {'users'}), {'audit'})
+
+    def test_foreign_key_cascade(self):
+        """Child tables with ON DELETE actions count only while foreign keys are enforced."""
+        self.assertEqual(transactional_module.implied_writes(self.conn, {'users'}), set())
+        self.conn.execute("PRAGMA foreign_keys = ON")
+        self.assertEqual(transactional_module.implied_writes(self.conn, {'users'}), {'orders'})
+
+    def test_track_writes(self):
+        """track_writes collects the traced writes plus the implied ones."""
+        self.conn.execute("PRAGMA foreign_keys = ON")
+        with transactional_module.track_writes(self.conn) as written:
+            self.conn.execute("DELETE FROM users WHERE id = 1")
+        self.assertEqual(written, {'users', 'orders'})
+
+
+class TestTransactional(DatabaseTestCase):
+    """Tests commit, rollback and nesting of @transactional."""
+
+    def test_commit_notifies_written_tables(self):
+        """A committed transaction is persisted and announced with its tables."""
+        @transactional
+        def rename(conn):
+            conn.execute("UPDATE users SET name = 'Alicia' WHERE id = 1")
+
+        rename(self.conn)
+        self.assertFalse(self.conn.in_transaction)
+        self.assertEqual(self.notified, [{'users'}])
+
+    def test_rollback_notifies_nothing(self):
+        """A failing function is rolled back and no write is announced."""
+        @transactional
+        def fail(conn):
+            conn.execute("DELETE FROM users")
+            raise ValueError("boom")
+
+        with self.assertRaises(ValueError):
+            fail(self.conn)
+        self.assertEqual(self.count('users'), 2)
+        self.assertEqual(self.notified, [])
+
+    def test_nested_calls_share_the_outer_transaction(self):
+        """An inner @transactional call neither commits nor notifies on its own."""
+        @transactional
+        def add_user(conn, name):
+            conn.execute("INSERT INTO users (name) VALUES (?)", (name,))
+            self.assertTrue(conn.in_transaction)
+
+        @transactional
+        def add_users_and_order(conn):
+            add_user(conn, 'Carol')
+            self.assertEqual(self.notified, [])
+            self.assertEqual(self.count('users'), 2) # Not committed yet
+            conn.execute("INSERT INTO orders (user_id) VALUES (3)")
+
+        add_users_and_order(self.conn)
+        self.assertEqual(self.count('users'), 3)
+        self.assertEqual(self.notified, [{'users', 'orders'}])
+
+    def test_nested_failure_rolls_back_everything(self):
+        """A failure after an inner call rolls back the inner call's writes too."""
+        @transactional
+        def add_user(conn, name):
+            conn.execute("INSERT INTO users (name) VALUES (?)", (name,))
+
+        @transactional
+        def add_user_and_fail(conn):
+            add_user(conn, 'Carol')
+            raise ValueError("boom")
+
+        with self.assertRaises(ValueError):
+            add_user_and_fail(self.conn)
+        self.assertEqual(self.count('users'), 2)
+        self.assertEqual(self.notified, [])
+
+    def test_restores_isolation_level(self):
+        """The connection's isolation level is restored after the transaction."""
+        @transactional
+        def noop(conn):
+            pass
+
+        noop(self.conn)
+        self.assertEqual(self.conn.isolation_level, '')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,30 +1,35 @@
 #!/usr/bin/python3
 
-import seed
-from psycopg2.extras import RealDictCursor
+import backends
+import instrumentation
+from records import UserRecord
 
-def stream_users():
+ROW_FORMATS = ('dict', 'record')
+
+def stream_users(server_side=False, itersize=2000, row_format='dict'):
     """
     Uses a generator to fetch rows one by one from the user_data table.
     Yields each row as a dictionary.
+
+    With server_side=True the rows come from a server-side named cursor that
+    transfers `itersize` rows per round trip, so memory stays constant and
+    the first row is yielded as soon as the first chunk arrives.
+
+    With row_format='record' each row is a records.UserRecord, a __slots__
+    object several times smaller than a dict that still supports row['age'].
     """
-    connection = None
-    cursor = None
+    if row_format not in ROW_FORMATS:
+        raise ValueError(f"Unknown row_format {row_format!r}; expected one of {ROW_FORMATS}.")
+    backend = backends.get_backend()
     try:
-        connection = seed.connect_to_prodev()
-        if connection:
-            cursor = connection.cursor(cursor_factory=RealDictCursor)
-            cursor.execute("SELECT user_id, name, email, age FROM user_data")
-
-            while True:
-                row = cursor.fetchone()
-                if row is None:
-                    break
-                yield row
+        with backend.connection() as connection:
+            if connection:
+                rows = backend.stream(connection,
+                                      "SELECT user_id, name, email, age FROM user_data",
+                                      itersize=itersize, server_side=server_side,
+                                      dict_rows=row_format == 'dict')
+                if row_format == 'record':
+                    rows = (UserRecord(*row) for row in rows)
+                yield from instrumentation.instrument(rows, 'stream_users')
     except Exception as e:
         print(f"Error streaming users: {e}")
-    finally:
-        if cursor:
-            cursor.close()
-        if connection:
-            connection.close()
@@ -1,33 +1,60 @@
 #!/usr/bin/python3
 
-import seed
-from psycopg2.extras import RealDictCursor
+import backends
+import keyset
+import columnar
+import instrumentation
+from query import UserQuery
+from pipeline import pipe
 
-def stream_users_in_batches(batch_size):
+def stream_users_in_batches(batch_size, resume_token=None, key='user_id', query=None,
+                            columnar_format=None):
     """
     Generator function to fetch rows from the user_data table in batches.
+    Pages with keyset pagination on `key`, so every batch costs the same
+    however deep into the table it is. Pass a token from keyset.page_token(batch)
+    as resume_token to continue an interrupted scan after that batch.
+
+    An optional query.UserQuery restricts the rows and columns fetched: its
+    predicates and projection are compiled into the SQL, and only predicates
+    that cannot be pushed down are evaluated here.
+
+    With columnar_format='numpy' or 'arrow' each batch is a dict of NumPy arrays
+    or an Arrow RecordBatch built directly from tuple rows, instead of a list of dicts.
+    columnar_format='compact' gives a records.UserBatch, which needs no extra packages.
+
+    batch_size may be an adaptive.AdaptiveBatchSize instead of an int, to size
+    each batch for a target fetch latency or byte size; the sizes it chose are
+    in its `stats` afterwards.
     """
-    connection = None
-    cursor = None
+    query = query or UserQuery()
+    if columnar_format and query.python_filters:
+        raise ValueError("Python-side filters need dict rows; use pushed-down predicates "
+                         "with columnar batches.")
+    where, params = query.compile()
+    fetch_columns = query.fetch_columns()
+    selected = keyset.select_columns(fetch_columns, key)
+    backend = backends.get_backend()
     try:
-        connection = seed.connect_to_prodev()
-        if connection:
-            cursor = connection.cursor(cursor_factory=RealDictCursor)
-            offset = 0
-            while True:
-                cursor.execute(f"SELECT user_id, name, email, age FROM user_data LIMIT {batch_size} OFFSET {offset}")
-                batch = cursor.fetchall()
-                if not batch:
-                    break
-                yield batch
-                offset += batch_size
+        with backend.connection() as connection:
+            if connection:
+                pages = keyset.iter_pages(connection, batch_size, key=key,
+                                          resume_token=resume_token,
+                                          columns=fetch_columns,
+                                          where=where, params=params,
+                                          dict_rows=not columnar_format,
+                                          backend=backend)
+                pages = instrumentation.instrument(pages, 'stream_users_in_batches',
+                                                   batches=True)
+                for page in pages:
+                    if columnar_format:
+                        yield columnar.build(page, selected, columnar_format)
+                        continue
+                    batch = query.apply(page, key)
+                    if batch:
+                        yield batch
     except Exception as e:
         print(f"Error streaming users in batches: {e}")
-    finally:
-        if cursor:
-            cursor.close()
-        if connection:
-            connection.close()
     return # Added to satisfy autochecker
 
 def batch_processing(batch_size):
@@ -35,8 +62,7 @@ def batch_processing(batch_size):
     Processes each batch to filter users over the age of 25.
     Yields filtered users one by one.
     """
-    for batch in stream_users_in_batches(batch_size):
-        for user in batch:
-            if user['age'] > 25:
-                yield user
+    # The age filter runs in the database, so only matching users are fetched
+    over_25 = UserQuery().where('age', '>', 25)
+    yield from pipe(stream_users_in_batches(batch_size, query=over_25)).unbatch()
     return # Added to satisfy autochecker
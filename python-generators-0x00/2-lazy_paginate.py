@@ -1,36 +1,55 @@
 #!/usr/bin/python3
-import seed
-from psycopg2.extras import RealDictCursor
+import backends
+import instrumentation
+import keyset
+from prefetch import read_ahead
 
 def paginate_users(page_size, offset):
     """
     Fetches a single page of user data from the database.
     """
-    connection = None
-    cursor = None
+    backend = backends.get_backend()
     try:
-        connection = seed.connect_to_prodev()
-        cursor = connection.cursor(cursor_factory=RealDictCursor)
-        cursor.execute(f"SELECT * FROM user_data LIMIT {page_size} OFFSET {offset}")
-        rows = cursor.fetchall()
-        return rows
+        with backend.connection() as connection:
+            rows = backend.fetch_all(connection, "SELECT * FROM user_data LIMIT %s OFFSET %s",
+                                     (int(page_size), int(offset)))
+            return rows
     except Exception as e:
         print(f"Error in paginate_users: {e}")
         return []
-    finally:
-        if cursor:
-            cursor.close()
-        if connection:
-            connection.close()
 
-def lazy_pagination(page_size):
+def paginate_users_after(page_size, after=None, key='user_id'):
     """
-    Generator function that lazily loads pages of user data.
+    Fetches the page of user data that follows the key values `after`
+    using keyset pagination instead of OFFSET.
     """
-    offset = 0
+    backend = backends.get_backend()
+    try:
+        with backend.connection() as connection:
+            return keyset.fetch_page(connection, page_size, key=key, after=after,
+                                     backend=backend)
+    except Exception as e:
+        print(f"Error in paginate_users_after: {e}")
+        return []
+
+def _keyset_pages(page_size, after, key):
+    """Generator over consecutive keyset pages starting after the key values `after`."""
     while True:
-        page = paginate_users(page_size, offset)
+        page = paginate_users_after(page_size, after, key)
         if not page:
             break
         yield page
-        offset += page_size
+        after = keyset.row_key(page[-1], key)
+
+def lazy_pagination(page_size, resume_token=None, key='user_id', prefetch=0):
+    """
+    Generator function that lazily loads pages of user data.
+    Pages are fetched with keyset pagination on `key`; pass a token from
+    keyset.page_token(page) as resume_token to continue after that page.
+
+    With prefetch=N, up to N upcoming pages are fetched on a background thread
+    while the current page is being processed.
+    """
+    after = keyset.decode_token(resume_token, key) if resume_token else None
+    pages = read_ahead(_keyset_pages(page_size, after, key), prefetch)
+    yield from instrumentation.instrument(pages, 'lazy_pagination', batches=True)
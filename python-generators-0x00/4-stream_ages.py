@@ -1,45 +1,53 @@
 #!/usr/bin/python3
 
-import seed
+import backends
+import aggregate
+import instrumentation
 
 def stream_user_ages():
     """
     Generator that yields user ages one by one from the database.
     """
-    connection = None
-    cursor = None
+    backend = backends.get_backend()
     try:
-        connection = seed.connect_to_prodev()
-        if connection:
-            cursor = connection.cursor()
-            cursor.execute("SELECT age FROM user_data")
-            while True:
-                row = cursor.fetchone()
-                if row is None:
-                    break
-                yield float(row[0])
+        with backend.connection() as connection:
+            if connection:
+                rows = backend.stream(connection, "SELECT age FROM user_data",
+                                      server_side=False, dict_rows=False)
+                for row in instrumentation.instrument(rows, 'stream_user_ages'):
+                    yield float(row[0])
     except Exception as e:
         print(f"Error streaming user ages: {e}")
-    finally:
-        if cursor:
-            cursor.close()
-        if connection:
-            connection.close()
+
+def aggregate_user_ages(percentiles=aggregate.DEFAULT_PERCENTILES, source=None):
+    """
+    Returns count, sum, mean, min, max, stddev and percentiles of user ages.
+
+    The aggregates are computed in the database when possible. When `source`
+    (any iterable of ages, e.g. from a non-SQL store) is given, or the SQL
+    aggregation fails, a single streaming pass over the ages is used instead,
+    with approximate percentiles.
+    """
+    backend = backends.get_backend()
+    if source is None and backend.supports_sql_aggregates:
+        try:
+            with backend.connection() as connection:
+                if connection:
+                    return aggregate.sql_aggregate(connection, 'age', percentiles, backend=backend)
+        except Exception as e:
+            print(f"SQL aggregation unavailable, streaming ages instead: {e}")
+    if source is None:
+        source = stream_user_ages()
+    return aggregate.summarize(source, percentiles)
 
 def calculate_average_age():
     """
     Calculates the average age of users without loading the entire dataset into memory.
-    Uses the stream_user_ages generator.
+    The mean is computed by the database; only the aggregate crosses the wire.
     """
-    total_age = 0
-    count = 0
-    for age in stream_user_ages():
-        total_age += age
-        count += 1
-    
-    if count > 0:
-        average_age = total_age / count
-        print(f"Average age of users: {average_age:.2f}")
+    stats = aggregate_user_ages(percentiles=())
+    if stats['count']:
+        print(f"Average age of users: {stats['mean']:.2f}")
     else:
         print("No user data found to calculate average age.")
 
@@ -0,0 +1,110 @@
+#!/usr/bin/python3
+"""
+Adaptive batch sizing for the paginated user streams.
+
+An AdaptiveBatchSize is passed in place of a fixed batch size. After every
+fetch it is told how long the fetch took and how wide the rows were, keeps a
+smoothed per-row cost, and picks the next batch size so a batch takes about
+`target_seconds` and/or weighs about `target_bytes`, within [min_size,
+max_size]. Batches grow at most twofold per step so one fast page cannot make
+the next one huge. The sizes it chose are kept in `stats`, a plain
+JSON-serializable dict.
+"""
+
+_SAMPLE_ROWS = 32 # Rows measured per page when estimating its width
+
+def row_nbytes(row):
+    """Approximate payload size of a row (dict or tuple): text length, 8 bytes per number."""
+    values = row.values() if isinstance(row, dict) else row
+    size = 0
+    for value in values:
+        if value is None:
+            continue
+        if isinstance(value, (str, bytes)):
+            size += len(value)
+        else:
+            size += 8
+    return size
+
+def page_nbytes(page):
+    """Estimates the payload size of a list of rows from an evenly spaced sample."""
+    count = len(page)
+    if not count:
+        return 0
+    step = max(1, count // _SAMPLE_ROWS)
+    sample = page[::step]
+    return sum(row_nbytes(row) for row in sample) * count // len(sample)
+
+class AdaptiveBatchSize:
+    """Chooses batch sizes that meet a latency and/or byte target."""
+
+    def __init__(self, initial=1000, min_size=100, max_size=50_000, target_seconds=None,
+                 target_bytes=None, smoothing=0.5, history=100):
+        """
+        Args:
+            initial (int): Size of the first batch.
+            min_size (int), max_size (int): Bounds on every batch size.
+            target_seconds (float, optional): Desired fetch time per batch.
+            target_bytes (int, optional): Desired payload size per batch.
+            smoothing (float): Weight of the newest measurement in the running averages.
+            history (int): Number of recent batch sizes kept in stats.
+        """
+        if target_seconds is None and target_bytes is None:
+            raise ValueError("Give target_seconds, target_bytes or both.")
+        if not 1 <= min_size <= max_size:
+            raise ValueError("Need 1 <= min_size <= max_size.")
+        self.min_size = min_size
+        self.max_size = max_size
+        self.target_seconds = target_seconds
+        self.target_bytes = target_bytes
+        self.smoothing = smoothing
+        self.history = history
+        self.size = min(max(initial, min_size), max_size)
+        self.seconds_per_row = None
+        self.bytes_per_row = None
+        self.stats = {
+            'batches': 0,
+            'rows': 0,
+            'bytes': 0,
+            'fetch_seconds': 0.0,
+            'batch_size': self.size,
+            'min_batch_size': None,
+            'max_batch_size': None,
+            'recent_sizes': [], # The last `history` batch sizes, oldest first
+        }
+
+    def _smooth(self, previous, current):
+        if previous is None:
+            return current
+        return self.smoothing * current + (1 - self.smoothing) * previous
+
+    def observe(self, rows, seconds, nbytes):
+        """
+        Records one fetch of `rows` rows and returns the next batch size.
+        An empty fetch (the end of the table) is not counted as a batch.
+        """
+        if not rows:
+            return self.size
+        stats = self.stats
+        stats['batches'] += 1
+        stats['rows'] += rows
+        stats['bytes'] += nbytes
+        stats['fetch_seconds'] += seconds
+        stats['recent_sizes'].append(self.size)
+        if len(stats['recent_sizes']) > self.history:
+            del stats['recent_sizes'][0]
+        stats['min_batch_size'] = min(stats['min_batch_size'] or self.size, self.size)
+        stats['max_batch_size'] = max(stats['max_batch_size'] or self.size, self.size)
+        self.seconds_per_row = self._smooth(self.seconds_per_row, seconds / rows)
+        self.bytes_per_row = self._smooth(self.bytes_per_row, nbytes / rows)
+
+        candidates = []
+        if self.target_seconds is not None and self.seconds_per_row:
+            candidates.append(self.target_seconds / self.seconds_per_row)
+        if self.target_bytes is not None and self.bytes_per_row:
+            candidates.append(self.target_bytes / self.bytes_per_row)
+        if candidates:
+            wanted = min(min(candidates), self.size * 2)
+            self.size = int(min(max(wanted, self.min_size), self.max_size))
+        stats['batch_size'] = self.size
+        return self.size
@@ -0,0 +1,168 @@
+#!/usr/bin/python3
+"""
+Aggregation helpers for streamed numeric columns.
+
+sql_aggregate computes count, sum, mean, min, max, stddev and percentiles
+inside the database. For data that does not come from SQL, summarize makes
+a single pass over any iterable with Welford's algorithm and a KLL quantile
+sketch, so memory stays bounded no matter how many values are streamed.
+"""
+
+import math
+import random
+
+import backends
+from keyset import quote_ident, TABLE
+
+DEFAULT_PERCENTILES = (0.5, 0.9, 0.99)
+
+class RunningStats:
+    """Single-pass count, sum, mean, min, max and sample stddev (Welford's algorithm)."""
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.mean = 0.0
+        self._m2 = 0.0
+        self.min = None
+        self.max = None
+
+    def update(self, value):
+        """Adds one value."""
+        self.count += 1
+        self.total += value
+        delta = value - self.mean
+        self.mean += delta / self.count
+        self._m2 += delta * (value - self.mean)
+        if self.min is None or value < self.min:
+            self.min = value
+        if self.max is None or value > self.max:
+            self.max = value
+
+    @property
+    def stddev(self):
+        """Sample standard deviation, matching SQL's stddev_samp; None below two values."""
+        if self.count < 2:
+            return None
+        return math.sqrt(self._m2 / (self.count - 1))
+
+class QuantileSketch:
+    """
+    KLL quantile sketch.
+
+    Values are kept in a hierarchy of compactors where an item at level h stands
+    for 2**h input values. When the sketch is full a level is sorted and every
+    other item is promoted, so memory stays around 3*k items and rank error
+    is roughly 1/k regardless of the stream length.
+    """
+
+    def __init__(self, k=200, seed=None):
+        self.k = k
+        self.count = 0
+        self._levels = [[]]
+        self._size = 0
+        self._max_size = self._capacity(0)
+        self._random = random.Random(seed)
+
+    def _capacity(self, level):
+        depth = len(self._levels) - level - 1
+        return int(math.ceil(self.k * (2 / 3) ** depth)) + 1
+
+    def update(self, value):
+        """Adds one value."""
+        self._levels[0].append(value)
+        self._size += 1
+        self.count += 1
+        if self._size >= self._max_size:
+            self._compress()
+
+    def _compress(self):
+        for level in range(len(self._levels)):
+            items = self._levels[level]
+            if len(items) < self._capacity(level):
+                continue
+            if level + 1 == len(self._levels):
+                self._levels.append([])
+            items.sort()
+            # An odd item out stays behind so the total weight is preserved
+            leftover = [items.pop()] if len(items) % 2 else []
+            offset = self._random.randint(0, 1)
+            promoted = items[offset::2]
+            self._levels[level + 1].extend(promoted)
+            self._levels[level] = leftover
+            self._size += len(promoted) - len(items)
+            break
+        self._max_size = sum(self._capacity(level) for level in range(len(self._levels)))
+
+    def quantile(self, q):
+        """Returns an approximate q-quantile (0 <= q <= 1), or None if empty."""
+        if not 0 <= q <= 1:
+            raise ValueError("Quantile must be between 0 and 1.")
+        weighted = sorted(
+            (value, 1 << level)
+            for level, items in enumerate(self._levels)
+            for value in items
+        )
+        if not weighted:
+            return None
+        total = sum(weight for _, weight in weighted)
+        target = q * total
+        seen = 0
+        for value, weight in weighted:
+            seen += weight
+            if seen >= target:
+                return value
+        return weighted[-1][0]
+
+def summarize(values, percentiles=DEFAULT_PERCENTILES, k=200):
+    """
+    Aggregates an iterable of numbers in a single pass.
+    Percentiles are approximate (KLL sketch with parameter k).
+    """
+    stats = RunningStats()
+    sketch = QuantileSketch(k)
+    for value in values:
+        value = float(value)
+        stats.update(value)
+        sketch.update(value)
+    return {
+        'count': stats.count,
+        'sum': stats.total,
+        'mean': stats.mean if stats.count else None,
+        'min': stats.min,
+        'max': stats.max,
+        'stddev': stats.stddev,
+        'percentiles': {q: sketch.quantile(q) for q in percentiles},
+    }
+
+def _as_float(value):
+    return None if value is None else float(value)
+
+def sql_aggregate(connection, column='age', percentiles=DEFAULT_PERCENTILES, table=TABLE,
+                  backend=None):
+    """
+    Computes the aggregates for `column` inside the database (PostgreSQL).
+    Percentiles are exact (percentile_cont, which interpolates between rows).
+    """
+    backend = backend or backends.get_backend()
+    name = quote_ident(column)
+    rows = backend.fetch_all(
+        connection,
+        f"SELECT count({name}), sum({name}), avg({name}), min({name}), max({name}), "
+        f"stddev_samp({name}), "
+        f"percentile_cont(%s::float8[]) WITHIN GROUP (ORDER BY {name}) "
+        f"FROM {quote_ident(table)}",
+        (list(percentiles),),
+        dict_rows=False
+    )
+    count, total, mean, low, high, stddev, quantiles = rows[0]
+    quantiles = quantiles or [None] * len(percentiles)
+    return {
+        'count': count,
+        'sum': _as_float(total) if count else 0.0,
+        'mean': _as_float(mean),
+        'min': _as_float(low),
+        'max': _as_float(high),
+        'stddev': _as_float(stddev),
+        'percentiles': {q: _as_float(v) for q, v in zip(percentiles, quantiles)},
+    }
@@ -0,0 +1,165 @@
+#!/usr/bin/python3
+"""
+Async generator versions of the user streaming functions.
+
+They run on asyncpg with its own connection pool, so serving user_data from
+an asyncio application never blocks the event loop. Paged variants fetch
+the next page in the background while the consumer handles the current one.
+Rows are yielded as dicts, the same shape the synchronous generators produce.
+"""
+
+import asyncio
+import uuid
+from decimal import Decimal
+
+import asyncpg
+
+import seed
+import keyset
+import columnar
+from query import UserQuery
+
+# asyncpg pools and asyncio locks belong to the event loop they were created
+# on, so each running loop gets its own state, keyed by id(loop):
+# {'loop': loop, 'lock': asyncio.Lock, 'pool': asyncpg pool, 'guard': async generator}
+_loop_states = {}
+
+def _prune_closed_loops():
+    """Drops the state of loops that were closed without shutting their pool down."""
+    for key, state in list(_loop_states.items()):
+        if state['loop'].is_closed():
+            del _loop_states[key]
+            if state['pool'] is not None:
+                try:
+                    state['pool'].terminate()
+                except Exception:
+                    pass
+
+def _loop_state(loop):
+    _prune_closed_loops()
+    state = _loop_states.get(id(loop))
+    if state is None or state['loop'] is not loop:
+        state = _loop_states[id(loop)] = {
+            'loop': loop, 'lock': asyncio.Lock(), 'pool': None, 'guard': None,
+        }
+    return state
+
+async def _close_at_shutdown(state):
+    """
+    Started once per pool, so the loop tracks it as a live async generator:
+    loop.shutdown_asyncgens(), which asyncio.run() calls before closing the
+    loop, finalizes it and the pool is closed while its loop still runs.
+    """
+    try:
+        yield
+    finally:
+        pool, state['pool'], state['guard'] = state['pool'], None, None
+        if _loop_states.get(id(state['loop'])) is state:
+            del _loop_states[id(state['loop'])]
+        if pool is not None:
+            await pool.close()
+
+async def get_async_pool():
+    """Returns the asyncpg pool of the running event loop, creating it on first use."""
+    state = _loop_state(asyncio.get_running_loop())
+    async with state['lock']:
+        if state['pool'] is None:
+            state['pool'] = await asyncpg.create_pool(
+                host=seed.DB_HOST,
+                user=seed.DB_USER,
+                password=seed.DB_PASSWORD,
+                database=seed.DB_NAME,
+                port=seed.DB_PORT,
+                min_size=seed.DB_POOL_MIN,
+                max_size=seed.DB_POOL_MAX,
+                max_inactive_connection_lifetime=seed.DB_POOL_IDLE_TIMEOUT,
+            )
+            state['guard'] = _close_at_shutdown(state)
+            await state['guard'].asend(None)
+        return state['pool']
+
+async def close_async_pool():
+    """
+    Closes the asyncpg pool of the running event loop. asyncio.run() does this
+    on its own at shutdown; loops driven by hand should await it before closing.
+    """
+    state = _loop_state(asyncio.get_running_loop())
+    async with state['lock']:
+        if state['guard'] is not None:
+            await state['guard'].aclose()
+
+def _numbered(sql):
+    """Rewrites %s placeholders as asyncpg's $1, $2, ..."""
+    parts = sql.split('%s')
+    return ''.join(part + (f"${i}" if i < len(parts) else '')
+                   for i, part in enumerate(parts, start=1))
+
+def _coerce_after(key, after):
+    """asyncpg binds NUMERIC parameters as Decimal, but resume tokens carry strings."""
+    return tuple(
+        Decimal(str(value)) if columnar.COLUMN_TYPES.get(col) is float and value is not None
+        else value
+        for col, value in zip(keyset.key_columns(key), after)
+    )
+
+def _row(record):
+    """A record as a dict, with UUID columns as strings like psycopg2 returns them."""
+    return {name: str(value) if isinstance(value, uuid.UUID) else value
+            for name, value in record.items()}
+
+async def _fetch_page(page_size, key, after, columns, where, params):
+    sql, query_params = keyset.page_query(page_size, key, after, columns, where, params)
+    pool = await get_async_pool()
+    async with pool.acquire() as connection:
+        records = await connection.fetch(_numbered(sql), *query_params)
+    return [_row(record) for record in records]
+
+async def astream_users(itersize=2000):
+    """
+    Async generator that yields user_data rows one by one as dicts.
+    Rows come from a server-side cursor that prefetches `itersize` rows at a time.
+    """
+    pool = await get_async_pool()
+    async with pool.acquire() as connection:
+        async with connection.transaction():
+            cursor = connection.cursor("SELECT user_id, name, email, age FROM user_data",
+                                       prefetch=itersize)
+            async for record in cursor:
+                yield _row(record)
+
+async def astream_users_in_batches(batch_size, resume_token=None, key='user_id', query=None):
+    """
+    Async generator that yields keyset-paginated batches of user dicts.
+    The next batch is fetched in the background while the current one is being
+    consumed. Accepts the same resume tokens and query.UserQuery as the
+    synchronous stream_users_in_batches.
+    """
+    query = query or UserQuery()
+    where, params = query.compile()
+    columns = query.fetch_columns()
+    after = _coerce_after(key, keyset.decode_token(resume_token, key)) if resume_token else None
+    pending = asyncio.ensure_future(_fetch_page(batch_size, key, after, columns, where, params))
+    try:
+        while pending is not None:
+            page = await pending
+            pending = None
+            if not page:
+                break
+            if len(page) == batch_size:
+                after = keyset.row_key(page[-1], key)
+                pending = asyncio.ensure_future(
+                    _fetch_page(batch_size, key, after, columns, where, params))
+            batch = query.apply(page, key)
+            if batch:
+                yield batch
+    finally:
+        if pending is not None and not pending.done():
+            pending.cancel()
+
+async def alazy_pagination(page_size, resume_token=None, key='user_id'):
+    """
+    Async generator that lazily loads pages of user data, prefetching the next page
+    while the current one is being handled.
+    """
+    async for page in astream_users_in_batches(page_size, resume_token, key):
+        yield page
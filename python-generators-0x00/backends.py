@@ -0,0 +1,220 @@
+#!/usr/bin/python3
+"""
+Database backends for the user_data generators.
+
+The generators write SQL once, with %s placeholders, and talk to the database
+only through a Backend: checking connections out, fetching pages, streaming
+rows and bulk loading. PostgresBackend keeps the pooled psycopg2 behaviour
+(server-side cursors, COPY). SQLiteBackend runs the same pipelines embedded,
+without a database server, which is handy for benchmarks and local runs.
+
+The default backend comes from the DB_BACKEND environment variable
+('postgres' or 'sqlite'; SQLITE_PATH names the SQLite file) and can be
+replaced with set_backend().
+"""
+
+import os
+import sqlite3
+import threading
+from abc import ABC, abstractmethod
+from contextlib import contextmanager
+
+import instrumentation
+
+class Backend(ABC):
+    """Common interface of the generator backends."""
+
+    name = None
+    placeholder = '%s'
+    # Whether sql_aggregate's percentile_cont query can run on this backend
+    supports_sql_aggregates = False
+
+    def sql(self, query):
+        """Rewrites a query written with %s placeholders into this backend's style."""
+        if self.placeholder == '%s':
+            return query
+        return query.replace('%s', self.placeholder)
+
+    @abstractmethod
+    def connection(self):
+        """Context manager yielding a connection (or None if none could be opened)."""
+
+    @abstractmethod
+    def fetch_all(self, connection, query, params=(), dict_rows=True):
+        """Runs a query and returns all rows, as dicts or tuples."""
+
+    @abstractmethod
+    def stream(self, connection, query, params=(), itersize=2000, server_side=True,
+               dict_rows=True):
+        """Generator over the rows of a query, fetched `itersize` at a time."""
+
+    @abstractmethod
+    def create_table(self, connection):
+        """Creates user_data if it does not exist."""
+
+    @abstractmethod
+    def bulk_load(self, connection, rows):
+        """
+        Loads (user_id, name, email, age) tuples into user_data, skipping existing
+        user_ids, and commits. Returns the number of rows inserted.
+        """
+
+class PostgresBackend(Backend):
+    """psycopg2 on the shared seed connection pool."""
+
+    name = 'postgres'
+    supports_sql_aggregates = True
+
+    def connection(self):
+        import seed
+        return seed.pooled_connection()
+
+    def fetch_all(self, connection, query, params=(), dict_rows=True):
+        from psycopg2.extras import RealDictCursor
+        cursor = connection.cursor(cursor_factory=RealDictCursor if dict_rows else None)
+        try:
+            instrumentation.timed('fetch_seconds', lambda: cursor.execute(query, params),
+                                  backend=self.name)
+            return instrumentation.timed_fetch(cursor.fetchall, self.name)
+        finally:
+            cursor.close()
+
+    def stream(self, connection, query, params=(), itersize=2000, server_side=True,
+               dict_rows=True):
+        import seed
+        from psycopg2.extras import RealDictCursor
+        factory = RealDictCursor if dict_rows else None
+        if server_side:
+            cursor = seed.server_cursor(connection, 'stream', itersize, cursor_factory=factory)
+        else:
+            cursor = connection.cursor(cursor_factory=factory)
+        try:
+            instrumentation.timed('fetch_seconds', lambda: cursor.execute(query, params),
+                                  backend=self.name)
+            while True:
+                rows = instrumentation.timed_fetch(lambda: cursor.fetchmany(itersize), self.name)
+                if not rows:
+                    break
+                yield from rows
+        finally:
+            cursor.close()
+
+    def create_table(self, connection):
+        import seed
+        seed.create_table(connection)
+
+    def bulk_load(self, connection, rows):
+        import seed
+        cursor = connection.cursor()
+        try:
+            _, inserted = seed.copy_merge(cursor, rows)
+            connection.commit()
+            return inserted
+        finally:
+            cursor.close()
+
+def _dict_row(cursor, row):
+    return {description[0]: value for description, value in zip(cursor.description, row)}
+
+class SQLiteBackend(Backend):
+    """
+    The standard library sqlite3 module. SQLite cursors already step through
+    results lazily, so streaming uses fetchmany on an ordinary cursor.
+    """
+
+    name = 'sqlite'
+    placeholder = '?'
+
+    def __init__(self, path=None):
+        self.path = path or os.getenv('SQLITE_PATH', 'user_data.db')
+
+    def connect(self):
+        """Opens a new connection; SQLite connections are cheap, so they are not pooled."""
+        return sqlite3.connect(self.path)
+
+    @contextmanager
+    def connection(self):
+        connection = instrumentation.timed('connection_wait_seconds', self.connect,
+                                           backend=self.name)
+        try:
+            yield connection
+        finally:
+            connection.rollback()
+            connection.close()
+
+    def _cursor(self, connection, dict_rows):
+        cursor = connection.cursor()
+        if dict_rows:
+            cursor.row_factory = _dict_row
+        return cursor
+
+    def fetch_all(self, connection, query, params=(), dict_rows=True):
+        cursor = self._cursor(connection, dict_rows)
+        try:
+            instrumentation.timed('fetch_seconds', lambda: cursor.execute(self.sql(query), params),
+                                  backend=self.name)
+            return instrumentation.timed_fetch(cursor.fetchall, self.name)
+        finally:
+            cursor.close()
+
+    def stream(self, connection, query, params=(), itersize=2000, server_side=True,
+               dict_rows=True):
+        cursor = self._cursor(connection, dict_rows)
+        try:
+            instrumentation.timed('fetch_seconds', lambda: cursor.execute(self.sql(query), params),
+                                  backend=self.name)
+            while True:
+                rows = instrumentation.timed_fetch(lambda: cursor.fetchmany(itersize), self.name)
+                if not rows:
+                    break
+                yield from rows
+        finally:
+            cursor.close()
+
+    def create_table(self, connection):
+        connection.execute("""
+        CREATE TABLE IF NOT EXISTS user_data (
+            user_id TEXT PRIMARY KEY,
+            name TEXT NOT NULL,
+            email TEXT NOT NULL,
+            age REAL NOT NULL
+        )
+        """)
+        connection.commit()
+
+    def bulk_load(self, connection, rows):
+        before = connection.total_changes
+        connection.executemany(
+            "INSERT OR IGNORE INTO user_data (user_id, name, email, age) VALUES (?, ?, ?, ?)",
+            rows
+        )
+        connection.commit()
+        return connection.total_changes - before
+
+BACKENDS = {
+    'postgres': PostgresBackend,
+    'sqlite': SQLiteBackend,
+}
+
+_backend = None
+_backend_lock = threading.Lock()
+
+def get_backend():
+    """Returns the active backend, creating it from DB_BACKEND on first use."""
+    global _backend
+    with _backend_lock:
+        if _backend is None:
+            name = os.getenv('DB_BACKEND', 'postgres')
+            if name not in BACKENDS:
+                raise ValueError(f"Unknown DB_BACKEND {name!r}; expected one of {sorted(BACKENDS)}.")
+            _backend = BACKENDS[name]()
+        return _backend
+
+def set_backend(backend):
+    """Makes `backend` (a Backend instance or a name from BACKENDS) the active backend."""
+    global _backend
+    if isinstance(backend, str):
+        backend = BACKENDS[backend]()
+    with _backend_lock:
+        _backend = backend
+    return backend
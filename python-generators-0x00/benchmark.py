@@ -0,0 +1,275 @@
+#!/usr/bin/python3
+"""
+Benchmark harness for the user streaming strategies.
+
+Seeds synthetic user_data tables of the requested sizes, then runs each
+strategy (stream_users, stream_users_in_batches, lazy_pagination) across
+batch and page sizes. For each run it reports rows/sec, time to first row,
+peak RSS and the number of queries issued. Every run happens in a freshly
+spawned process so its memory peak is not polluted by earlier runs.
+Results are printed as JSON.
+
+Usage:
+    ./benchmark.py --backend sqlite --sizes 10000 1000000
+    ./benchmark.py --backend postgres --reseed --sizes 10000 --output results.json
+
+With --backend postgres the generators run against the database configured in
+.env. --reseed TRUNCATES that database's user_data table, so point DB_NAME at a
+scratch database. Without --reseed the existing rows are benchmarked as they are.
+With --backend sqlite the same generators run through backends.SQLiteBackend
+on a temporary database file.
+"""
+
+import argparse
+import json
+import multiprocessing
+import os
+import platform
+import queue
+import resource
+import shutil
+import sys
+import tempfile
+import time
+
+import backends
+import synthetic
+
+DEFAULT_SIZES = (10_000, 1_000_000, 10_000_000)
+DEFAULT_BATCH_SIZES = (100, 1000, 10000)
+
+# --- Query counting ---------------------------------------------------------
+
+class CountingCursor:
+    """Cursor proxy that counts execute() calls and server-side fetch round trips."""
+
+    def __init__(self, cursor, counter):
+        self._cursor = cursor
+        self._counter = counter
+
+    def execute(self, *args, **kwargs):
+        self._counter['queries'] += 1
+        return self._cursor.execute(*args, **kwargs)
+
+    def fetchmany(self, *args, **kwargs):
+        if self._cursor.name:
+            self._counter['queries'] += 1 # Each named-cursor fetchmany is a FETCH round trip
+        return self._cursor.fetchmany(*args, **kwargs)
+
+    def __iter__(self):
+        return iter(self._cursor)
+
+    def __getattr__(self, name):
+        return getattr(self._cursor, name)
+
+    def __setattr__(self, name, value):
+        if name.startswith('_'):
+            object.__setattr__(self, name, value)
+        else:
+            setattr(self._cursor, name, value)
+
+class CountingConnection:
+    """Connection proxy whose cursors count the queries they issue."""
+
+    def __init__(self, connection, counter):
+        self._connection = connection
+        self._counter = counter
+
+    def cursor(self, *args, **kwargs):
+        return CountingCursor(self._connection.cursor(*args, **kwargs), self._counter)
+
+    def __getattr__(self, name):
+        return getattr(self._connection, name)
+
+class CountingSQLiteBackend(backends.SQLiteBackend):
+    """SQLite backend whose connections count the statements they run."""
+
+    def __init__(self, path, counter):
+        super().__init__(path)
+        self.counter = counter
+
+    def connect(self):
+        connection = super().connect()
+        connection.set_trace_callback(
+            lambda statement: self.counter.__setitem__('queries', self.counter['queries'] + 1))
+        return connection
+
+# --- Seeding ----------------------------------------------------------------
+
+def _seed(backend, size, seed_value=0):
+    """Replaces the contents of user_data with `size` synthetic rows."""
+    workers = os.cpu_count() or 1
+    if backend.name == 'sqlite':
+        if os.path.exists(backend.path):
+            os.remove(backend.path)
+        synthetic.load_sqlite(backend.path, size, seed_value, workers=workers)
+        return
+    import seed
+    connection = seed.connect_to_prodev()
+    try:
+        backend.create_table(connection)
+        cursor = connection.cursor()
+        cursor.execute("TRUNCATE user_data")
+        cursor.close()
+        synthetic.load_postgres(connection, size, seed_value, workers=workers)
+        connection.autocommit = True
+        cursor = connection.cursor()
+        cursor.execute("ANALYZE user_data")
+        cursor.close()
+    finally:
+        connection.close()
+
+def _postgres_count():
+    import seed
+    connection = seed.connect_to_prodev()
+    cursor = connection.cursor()
+    cursor.execute("SELECT COUNT(*) FROM user_data")
+    count = cursor.fetchone()[0]
+    cursor.close()
+    connection.close()
+    return count
+
+def _strategy(name, param):
+    """Returns a row iterator for one strategy, run through the active backend."""
+    if name == 'stream_users':
+        return __import__('0-stream_users').stream_users()
+    if name == 'stream_users_server_side':
+        return __import__('0-stream_users').stream_users(server_side=True, itersize=param)
+    if name == 'stream_users_in_batches':
+        batches = __import__('1-batch_processing').stream_users_in_batches(param)
+        return (row for batch in batches for row in batch)
+    if name == 'lazy_pagination':
+        pages = __import__('2-lazy_paginate').lazy_pagination(param)
+        return (row for page in pages for row in page)
+    raise ValueError(f"Unknown strategy {name!r}")
+
+# --- Runner -----------------------------------------------------------------
+
+def _max_rss_kb():
+    """Peak resident set size of this process in KiB (ru_maxrss is in bytes on macOS)."""
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak // 1024 if sys.platform == 'darwin' else peak
+
+def _run(backend, name, param, path, results):
+    """Child process: runs one strategy to completion and reports its measurements."""
+    counter = {'queries': 0}
+    baseline_rss = _max_rss_kb()
+    try:
+        if backend == 'postgres':
+            import seed
+            backends.set_backend('postgres')
+            seed.configure_pool(minconn=0, maxconn=4,
+                                connect=lambda: CountingConnection(seed.connect_to_prodev(), counter))
+        else:
+            backends.set_backend(CountingSQLiteBackend(path, counter))
+        start = time.perf_counter()
+        rows = _strategy(name, param)
+        first_row_at = None
+        count = 0
+        for _ in rows:
+            if first_row_at is None:
+                first_row_at = time.perf_counter()
+            count += 1
+        elapsed = time.perf_counter() - start
+        results.put({
+            'rows': count,
+            'seconds': round(elapsed, 6),
+            'rows_per_sec': round(count / elapsed, 1) if elapsed > 0 else None,
+            'time_to_first_row': round(first_row_at - start, 6) if first_row_at else None,
+            'peak_rss_kb': _max_rss_kb(),
+            'baseline_rss_kb': baseline_rss,
+            'queries': counter['queries'],
+        })
+    except Exception as e:
+        results.put({'error': f"{type(e).__name__}: {e}"})
+
+def _collect(process, results, poll=1.0):
+    """
+    Waits for a run's result, or for its process to die without one (an OOM
+    kill or a driver crash), in which case an error entry is returned.
+    """
+    while True:
+        try:
+            return results.get(timeout=poll)
+        except queue.Empty:
+            if process.is_alive():
+                continue
+        try:
+            # The result may have been flushed just before the process exited
+            return results.get(timeout=poll)
+        except queue.Empty:
+            process.join()
+            return {'error': f"strategy process exited with code {process.exitcode} "
+                             "without reporting a result"}
+
+def plan(backend, batch_sizes):
+    """Returns the (strategy, parameter) pairs to run for a backend."""
+    runs = [('stream_users', None)]
+    runs += [('stream_users_server_side', size) for size in batch_sizes]
+    runs += [('stream_users_in_batches', size) for size in batch_sizes]
+    runs += [('lazy_pagination', size) for size in batch_sizes]
+    return runs
+
+def run_benchmarks(backend='sqlite', sizes=DEFAULT_SIZES, batch_sizes=DEFAULT_BATCH_SIZES,
+                   reseed=False, seed=0):
+    """Runs every strategy for every table size and returns the report as a dict."""
+    context = multiprocessing.get_context('spawn')
+    report = {
+        'backend': backend,
+        'seed': seed,
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'results': [],
+    }
+    workdir = tempfile.mkdtemp(prefix='user_data_bench_')
+    try:
+        if backend == 'postgres' and not reseed:
+            sizes = (_postgres_count(),)
+        for size in sizes:
+            path = os.path.join(workdir, f"user_data_{size}.db")
+            if backend == 'sqlite':
+                _seed(backends.SQLiteBackend(path), size, seed)
+            elif reseed:
+                _seed(backends.PostgresBackend(), size, seed)
+            for name, param in plan(backend, batch_sizes):
+                results = context.Queue()
+                process = context.Process(target=_run, args=(backend, name, param, path, results))
+                process.start()
+                outcome = _collect(process, results)
+                process.join()
+                entry = {'strategy': name, 'table_rows': size, 'batch_size': param}
+                entry.update(outcome)
+                report['results'].append(entry)
+                print(f"{name:<26} rows={size:<10} batch={param!s:<6} "
+                      f"{outcome.get('rows_per_sec', outcome.get('error'))} rows/sec",
+                      file=sys.stderr)
+            if os.path.exists(path):
+                os.remove(path)
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+    return report
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the user_data streaming strategies.")
+    parser.add_argument('--backend', choices=('sqlite', 'postgres'), default='sqlite')
+    parser.add_argument('--sizes', type=int, nargs='+', default=list(DEFAULT_SIZES),
+                        help="Table sizes to seed (ignored for postgres without --reseed).")
+    parser.add_argument('--batch-sizes', type=int, nargs='+', default=list(DEFAULT_BATCH_SIZES),
+                        help="Batch, page and itersize values to try.")
+    parser.add_argument('--reseed', action='store_true',
+                        help="postgres only: TRUNCATE user_data and load synthetic rows.")
+    parser.add_argument('--seed', type=int, default=0,
+                        help="Seed for the synthetic rows (see synthetic.py).")
+    parser.add_argument('--output', help="Write the JSON report to this file instead of stdout.")
+    args = parser.parse_args()
+
+    report = run_benchmarks(args.backend, args.sizes, args.batch_sizes, args.reseed, args.seed)
+    if args.output:
+        with open(args.output, 'w') as file:
+            json.dump(report, file, indent=2)
+        print(f"Results written to {args.output}")
+    else:
+        print(json.dumps(report, indent=2))
+
+if __name__ == '__main__':
+    main()
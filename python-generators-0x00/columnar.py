@@ -0,0 +1,84 @@
+#!/usr/bin/python3
+"""
+Columnar batch builders for user_data pages.
+
+Rows fetched as plain tuples are transposed straight into one NumPy array per
+column or an Arrow RecordBatch, so no per-row dict is created and downstream
+statistics and filters can run vectorized. NumPy and PyArrow are optional and
+only imported when a columnar format is requested. The 'compact' format is a
+records.UserBatch, which needs neither.
+"""
+
+# Python type of each user_data column; numeric columns become float64
+COLUMN_TYPES = {
+    'user_id': str,
+    'name': str,
+    'email': str,
+    'age': float,
+}
+
+FORMATS = ('numpy', 'arrow', 'compact')
+
+def _columns_of(rows, columns):
+    """Transposes tuple rows into one sequence per column."""
+    if not rows:
+        return [()] * len(columns)
+    return list(zip(*rows))
+
+def _floats(values):
+    # NUMERIC comes back as Decimal; convert once here rather than per consumer
+    return [None if value is None else float(value) for value in values]
+
+def to_numpy(rows, columns):
+    """Builds a dict of column name -> NumPy array from tuple rows."""
+    try:
+        import numpy as np
+    except ImportError as err:
+        raise ImportError("NumPy is required for columnar='numpy' (pip install numpy).") from err
+    batch = {}
+    for name, values in zip(columns, _columns_of(rows, columns)):
+        if COLUMN_TYPES.get(name) is float:
+            batch[name] = np.array(_floats(values), dtype=np.float64)
+        else:
+            batch[name] = np.array(values, dtype=object)
+    return batch
+
+def to_arrow(rows, columns):
+    """Builds an Arrow RecordBatch from tuple rows."""
+    try:
+        import pyarrow as pa
+    except ImportError as err:
+        raise ImportError("PyArrow is required for columnar='arrow' (pip install pyarrow).") from err
+    arrays = []
+    for name, values in zip(columns, _columns_of(rows, columns)):
+        if COLUMN_TYPES.get(name) is float:
+            arrays.append(pa.array(_floats(values), type=pa.float64()))
+        else:
+            arrays.append(pa.array(values, type=pa.string()))
+    return pa.RecordBatch.from_arrays(arrays, names=list(columns))
+
+def build(rows, columns, fmt):
+    """Builds a columnar batch in format `fmt` ('numpy', 'arrow' or 'compact')."""
+    if fmt == 'compact':
+        from records import UserBatch
+        return UserBatch.from_rows(rows, columns)
+    if fmt == 'numpy':
+        return to_numpy(rows, columns)
+    if fmt == 'arrow':
+        return to_arrow(rows, columns)
+    raise ValueError(f"Unknown columnar format {fmt!r}; expected one of {FORMATS}.")
+
+def batch_length(batch):
+    """Number of rows in a list, NumPy column dict, Arrow RecordBatch or UserBatch."""
+    if hasattr(batch, 'num_rows'):
+        return batch.num_rows
+    if isinstance(batch, dict):
+        return len(next(iter(batch.values()))) if batch else 0
+    return len(batch)
+
+def last_value(batch, column):
+    """Value of `column` in the last row of a columnar batch."""
+    if hasattr(batch, 'num_rows'):
+        return batch.column(batch.schema.get_field_index(column))[-1].as_py()
+    value = batch[column][-1]
+    return value.item() if hasattr(value, 'item') else value
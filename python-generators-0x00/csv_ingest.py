@@ -0,0 +1,186 @@
+#!/usr/bin/python3
+"""
+Chunked, parallel CSV validation for seeding user_data.
+
+The CSV file is split into byte ranges aligned to line boundaries. Each range
+is parsed, validated and normalized in a process pool worker, and the
+normalized rows come back to a single generator, in file order or in
+completion order, ready for the COPY loader in seed.py. Malformed rows are
+collected in a reject file instead of aborting the load.
+
+Byte splitting assumes records do not contain quoted newlines, which holds
+for the user_data exports. A record that straddles a chunk boundary anyway
+shows up as malformed in the reject file rather than being loaded wrongly.
+"""
+
+import csv
+import io
+import os
+import sys
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+from decimal import Decimal, InvalidOperation
+
+FIELDS = ('user_id', 'name', 'email', 'age')
+MAX_AGE = Decimal('999.99') # Largest age the NUMERIC(5, 2) age column holds
+
+def normalize_row(record):
+    """
+    Validates a dict of CSV fields and returns a (user_id, name, email, age) tuple.
+    Invalid user_ids are replaced by seed.repair_user_id, with the same stable id
+    sync_data assigns to the row.
+    Raises ValueError with the reason if the row cannot be loaded.
+    """
+    import seed # Imported here because seed imports this module
+
+    missing = [field for field in FIELDS[1:] if not record.get(field)]
+    if missing:
+        raise ValueError(f"missing {', '.join(missing)}")
+    try:
+        # Rounded half-up to cents, as NUMERIC(5, 2) does, before the range
+        # check: 999.995 would become 1000.00 and overflow the column mid-COPY
+        age = seed.round_age(record['age'])
+    except InvalidOperation:
+        raise ValueError(f"age is not a number: {record['age']!r}") from None
+    if not age.is_finite() or not 0 <= age <= MAX_AGE:
+        raise ValueError(f"age out of range: {record['age']!r}")
+    name, email = record['name'], record['email']
+    user_id = seed.repair_user_id(record.get('user_id'), f"{name}|{email}")
+    return (user_id, name, email, float(age))
+
+def read_header(path):
+    """Returns the header fields and the byte offset where the data starts."""
+    with open(path, 'rb') as file:
+        line = file.readline()
+    header = next(csv.reader([line.decode('utf-8-sig')]))
+    return header, len(line)
+
+def split_offsets(path, chunk_bytes, data_start):
+    """Splits the file after the header into (start, end) byte ranges on line starts."""
+    size = os.path.getsize(path)
+    ranges = []
+    with open(path, 'rb') as file:
+        start = data_start
+        while start < size:
+            end = min(start + chunk_bytes, size)
+            if end < size:
+                file.seek(end)
+                file.readline() # Move to the start of the next line
+                end = file.tell()
+            ranges.append((start, end))
+            start = end
+    return ranges
+
+def validate_chunk(path, index, start, end, header):
+    """
+    Worker: parses and normalizes the rows in bytes [start, end) of the file.
+    Returns (index, rows, rejects) where rejects are (line fields, reason) pairs.
+    """
+    with open(path, 'rb') as file:
+        file.seek(start)
+        data = file.read(end - start).decode('utf-8')
+    rows = []
+    rejects = []
+    for fields in csv.reader(io.StringIO(data, newline='')):
+        if not fields:
+            continue
+        if len(fields) != len(header):
+            rejects.append((fields, f"expected {len(header)} fields, got {len(fields)}"))
+            continue
+        try:
+            rows.append(normalize_row(dict(zip(header, fields))))
+        except ValueError as e:
+            rejects.append((fields, str(e)))
+    return index, rows, rejects
+
+class RejectWriter:
+    """Appends malformed rows, with the reason, to a CSV reject file."""
+
+    def __init__(self, path, header):
+        self.path = path
+        self.header = header
+        self.count = 0
+        self.file = None
+        self.writer = None
+
+    def write(self, rejects):
+        if not rejects:
+            return
+        self.count += len(rejects)
+        if self.path is None:
+            return
+        if self.file is None:
+            self.file = open(self.path, 'w', newline='')
+            self.writer = csv.writer(self.file)
+            self.writer.writerow(list(self.header) + ['error'])
+        for fields, reason in rejects:
+            self.writer.writerow(list(fields) + [reason])
+
+    def close(self):
+        if self.file:
+            self.file.close()
+
+def iter_validated_rows(path, workers=1, chunk_bytes=4 * 1024 * 1024, ordered=True,
+                        reject_file=None):
+    """
+    Generator that yields normalized (user_id, name, email, age) tuples from a CSV file.
+
+    Args:
+        path (str): CSV file with a user_id,name,email,age header.
+        workers (int): Worker processes; 1 validates in this process.
+        chunk_bytes (int): Approximate size of each chunk handed to a worker.
+        ordered (bool): Yield rows in file order instead of as chunks complete.
+        reject_file (str, optional): Where to write malformed rows and their reasons.
+    """
+    header, data_start = read_header(path)
+    missing = [field for field in FIELDS if field not in header]
+    if missing:
+        raise ValueError(f"CSV file '{path}' is missing columns: {', '.join(missing)}")
+    ranges = split_offsets(path, chunk_bytes, data_start)
+    rejects = RejectWriter(reject_file, header)
+    try:
+        if workers <= 1:
+            for index, (start, end) in enumerate(ranges):
+                _, rows, bad = validate_chunk(path, index, start, end, header)
+                rejects.write(bad)
+                yield from rows
+            return
+
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            pending = {}
+            done_chunks = {}
+            next_index = 0
+            chunks = iter(enumerate(ranges))
+            max_in_flight = workers * 2 # Bounds memory when the consumer is slower
+            try:
+                while True:
+                    while len(pending) + len(done_chunks) < max_in_flight:
+                        try:
+                            index, (start, end) = next(chunks)
+                        except StopIteration:
+                            break
+                        future = executor.submit(validate_chunk, path, index, start, end, header)
+                        pending[future] = index
+                    if not pending and not done_chunks:
+                        break
+                    if pending:
+                        finished, _ = wait(pending, return_when=FIRST_COMPLETED)
+                        for future in finished:
+                            del pending[future]
+                            index, rows, bad = future.result()
+                            rejects.write(bad)
+                            done_chunks[index] = rows
+                    if ordered:
+                        while next_index in done_chunks:
+                            yield from done_chunks.pop(next_index)
+                            next_index += 1
+                    else:
+                        for index in list(done_chunks):
+                            yield from done_chunks.pop(index)
+            finally:
+                for future in pending:
+                    future.cancel()
+    finally:
+        rejects.close()
+        if rejects.count:
+            target = f" (written to {reject_file})" if reject_file else ""
+            print(f"Rejected {rejects.count} malformed rows{target}.", file=sys.stderr)
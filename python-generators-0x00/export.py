@@ -0,0 +1,242 @@
+#!/usr/bin/python3
+"""
+Parallel export of user_data to compressed CSV or Parquet shards.
+
+The user_id key space is split into ranges (see partitioned_scan). Each range
+is exported by its own worker process, which runs COPY (SELECT ...) TO STDOUT
+and writes the stream straight into shard files, so no rows are built as
+Python objects for CSV and the table is never held in memory. A shard is
+closed and a new one started once it reaches the size limit. Every shard is
+listed in manifest.json with its row count, size and SHA-256 checksum.
+
+COPY is PostgreSQL-specific, so exports always use the PostgreSQL database
+configured in .env, whatever DB_BACKEND says.
+
+Usage:
+    ./export.py exports/ --format csv --partitions 8 --max-shard-mb 256
+    ./export.py exports/ --format parquet
+"""
+
+import argparse
+import hashlib
+import io
+import json
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import seed
+from columnar import COLUMN_TYPES
+from keyset import COLUMNS
+from partitioned_scan import partition_bounds, range_query
+
+FORMATS = ('csv', 'parquet')
+DEFAULT_MAX_SHARD_BYTES = 256 * 1024 * 1024
+PARQUET_BATCH_ROWS = 50_000 # Rows converted to Arrow at a time
+
+class _HashingFile:
+    """Binary file wrapper that counts and hashes everything written through it."""
+
+    def __init__(self, path):
+        self.file = open(path, 'wb')
+        self.sha256 = hashlib.sha256()
+        self.bytes = 0
+
+    def write(self, data):
+        self.sha256.update(data)
+        self.bytes += len(data)
+        return self.file.write(data)
+
+    def tell(self):
+        return self.bytes
+
+    def flush(self):
+        self.file.flush()
+
+    def close(self):
+        self.file.close()
+
+    @property
+    def closed(self):
+        return self.file.closed
+
+class _ShardSink:
+    """
+    File-like target for copy_expert. COPY TO sends exactly one CopyData
+    message per row and psycopg2 writes each one separately, so every write
+    is one whole row: rows are counted per write (a quoted name or email may
+    contain newlines) and shards are rotated between writes, never inside a row.
+    """
+
+    def __init__(self, directory, index, fmt, max_shard_bytes):
+        self.directory = directory
+        self.index = index
+        self.fmt = fmt
+        self.max_shard_bytes = max_shard_bytes
+        self.shards = []
+        self.current = None
+        self.pending = [] # Parquet only: CSV rows waiting to become a RecordBatch
+        self.pending_rows = 0
+        self.rows = 0 # Rows received from COPY
+
+    def _open(self):
+        number = len(self.shards)
+        suffix = 'csv.gz' if self.fmt == 'csv' else 'parquet'
+        name = f"user_data-{self.index:04d}-{number:04d}.{suffix}"
+        raw = _HashingFile(os.path.join(self.directory, name))
+        if self.fmt == 'csv':
+            import gzip
+            writer = gzip.GzipFile(filename='', mode='wb', fileobj=raw)
+            writer.write((','.join(COLUMNS) + '\n').encode())
+        else:
+            import pyarrow.parquet as pq
+            writer = pq.ParquetWriter(raw, _arrow_schema(), compression='zstd')
+        self.current = {'name': name, 'raw': raw, 'writer': writer, 'rows': 0}
+
+    def _close(self):
+        shard = self.current
+        if shard is None:
+            return
+        shard['writer'].close()
+        shard['raw'].close()
+        self.shards.append({
+            'file': shard['name'],
+            'partition': self.index,
+            'rows': shard['rows'],
+            'bytes': shard['raw'].bytes,
+            'sha256': shard['raw'].sha256.hexdigest(),
+        })
+        self.current = None
+
+    def write(self, data):
+        if isinstance(data, str):
+            data = data.encode()
+        self.rows += 1
+        if self.fmt == 'csv':
+            self._write_csv(data)
+        else:
+            self.pending.append(data)
+            self.pending_rows += 1
+            if self.pending_rows >= PARQUET_BATCH_ROWS:
+                self._write_parquet()
+        return len(data)
+
+    def _write_csv(self, data):
+        if self.current is None:
+            self._open()
+        self.current['writer'].write(data)
+        self.current['rows'] += 1
+        if self.current['raw'].bytes >= self.max_shard_bytes:
+            self._close()
+
+    def _write_parquet(self):
+        import pyarrow.csv as pacsv
+        data = b''.join(self.pending)
+        self.pending = []
+        self.pending_rows = 0
+        if not data:
+            return
+        table = pacsv.read_csv(
+            io.BytesIO(data),
+            read_options=pacsv.ReadOptions(column_names=list(COLUMNS)),
+            parse_options=pacsv.ParseOptions(newlines_in_values=True),
+            convert_options=pacsv.ConvertOptions(column_types=_arrow_schema()),
+        )
+        if self.current is None:
+            self._open()
+        self.current['writer'].write_table(table)
+        self.current['rows'] += table.num_rows
+        if self.current['raw'].bytes >= self.max_shard_bytes:
+            self._close()
+
+    def finish(self):
+        if self.fmt == 'parquet':
+            self._write_parquet()
+        self._close()
+        return self.shards
+
+def _arrow_schema():
+    import pyarrow as pa
+    return pa.schema([
+        (name, pa.float64() if COLUMN_TYPES.get(name) is float else pa.string())
+        for name in COLUMNS
+    ])
+
+def _export_partition(index, low, high, directory, fmt, max_shard_bytes):
+    """Worker: COPYs one key range into shards and returns their manifest entries."""
+    sink = _ShardSink(directory, index, fmt, max_shard_bytes)
+    with seed.pooled_connection() as connection:
+        if connection is None:
+            raise RuntimeError("could not connect to the database")
+        cursor = connection.cursor()
+        try:
+            # COPY takes no bind parameters, so the range bounds are inlined safely
+            query = cursor.mogrify(*range_query(low, high)).decode()
+            cursor.copy_expert(f"COPY ({query}) TO STDOUT WITH (FORMAT csv)", sink)
+            if cursor.rowcount >= 0 and cursor.rowcount != sink.rows:
+                raise RuntimeError(f"Partition {index}: COPY reported {cursor.rowcount} rows "
+                                   f"but {sink.rows} were written.")
+        finally:
+            cursor.close()
+    return sink.finish()
+
+def export_users(directory, fmt='csv', partitions=4, workers=None,
+                 max_shard_bytes=DEFAULT_MAX_SHARD_BYTES):
+    """
+    Exports user_data into `directory` and returns the manifest dict.
+
+    Args:
+        directory (str): Output directory, created if missing.
+        fmt (str): 'csv' for gzip-compressed CSV or 'parquet' (zstd, needs pyarrow).
+        partitions (int): Number of user_id ranges exported in parallel.
+        workers (int, optional): Worker processes, defaults to min(partitions, CPUs).
+        max_shard_bytes (int): Size after which a shard is closed and a new one started.
+    """
+    if fmt not in FORMATS:
+        raise ValueError(f"Unknown export format {fmt!r}; expected one of {FORMATS}.")
+    if fmt == 'parquet':
+        try:
+            import pyarrow.parquet # noqa: F401
+        except ImportError as err:
+            raise ImportError("PyArrow is required for Parquet exports (pip install pyarrow).") from err
+    os.makedirs(directory, exist_ok=True)
+    workers = workers or min(partitions, os.cpu_count() or 1)
+    start = time.perf_counter()
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = [
+            executor.submit(_export_partition, index, low, high, directory, fmt, max_shard_bytes)
+            for index, (low, high) in enumerate(partition_bounds(partitions))
+        ]
+        shards = [shard for future in futures for shard in future.result()]
+    manifest = {
+        'table': 'user_data',
+        'format': fmt,
+        'columns': list(COLUMNS),
+        'partitions': partitions,
+        'rows': sum(shard['rows'] for shard in shards),
+        'bytes': sum(shard['bytes'] for shard in shards),
+        'seconds': round(time.perf_counter() - start, 3),
+        'shards': shards,
+    }
+    path = os.path.join(directory, 'manifest.json')
+    with open(path + '.tmp', 'w') as file:
+        json.dump(manifest, file, indent=2)
+    os.replace(path + '.tmp', path)
+    return manifest
+
+def main():
+    parser = argparse.ArgumentParser(description="Export user_data to compressed shards.")
+    parser.add_argument('directory', help="Output directory for the shards and manifest.json.")
+    parser.add_argument('--format', choices=FORMATS, default='csv')
+    parser.add_argument('--partitions', type=int, default=4)
+    parser.add_argument('--workers', type=int)
+    parser.add_argument('--max-shard-mb', type=int, default=DEFAULT_MAX_SHARD_BYTES // (1024 * 1024))
+    args = parser.parse_args()
+
+    manifest = export_users(args.directory, args.format, args.partitions, args.workers,
+                            args.max_shard_mb * 1024 * 1024)
+    print(f"Exported {manifest['rows']} rows into {len(manifest['shards'])} shards "
+          f"({manifest['bytes']} bytes) in {manifest['seconds']}s.")
+
+if __name__ == '__main__':
+    main()
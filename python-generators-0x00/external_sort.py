@@ -0,0 +1,139 @@
+#!/usr/bin/python3
+"""
+External merge sort and dedupe for streams that do not fit in memory.
+
+Items are collected into a chunk until its estimated size reaches the memory
+budget. The chunk is sorted and spilled to a temporary file as a run of
+pickled batches, then the runs are k-way merged back with heapq.merge into a
+single sorted generator. Sorting is stable, so when deduplicating the first
+occurrence of each key in the input is the one kept.
+
+    by_age = external_sort(external_dedupe(stream_users(), key=itemgetter('email')),
+                           key=itemgetter('age'))
+"""
+
+import heapq
+import itertools
+import os
+import pickle
+import sys
+import tempfile
+
+DEFAULT_MEMORY_BUDGET = 64 * 1024 * 1024 # bytes
+MAX_FAN_IN = 64 # Runs merged at once, which bounds the number of open files
+_PICKLE_BATCH = 1000 # Items per pickle.dump call when spilling a run
+_SAMPLE_EVERY = 100 # Items between size measurements
+
+def approx_size(item):
+    """Rough in-memory size of an item, including one level of contained values."""
+    size = sys.getsizeof(item)
+    if isinstance(item, dict):
+        size += sum(sys.getsizeof(value) for value in item.values())
+    elif isinstance(item, (tuple, list)):
+        size += sum(sys.getsizeof(value) for value in item)
+    return size
+
+def _write_run(items, tmpdir):
+    """Writes sorted items to a temporary file and returns its path."""
+    descriptor, path = tempfile.mkstemp(prefix='user_sort_', suffix='.run', dir=tmpdir)
+    with os.fdopen(descriptor, 'wb') as file:
+        for start in range(0, len(items), _PICKLE_BATCH):
+            pickle.dump(items[start:start + _PICKLE_BATCH], file, pickle.HIGHEST_PROTOCOL)
+    return path
+
+def _read_run(path):
+    """Generator over the items of a run file, one pickled batch in memory at a time."""
+    with open(path, 'rb') as file:
+        while True:
+            try:
+                batch = pickle.load(file)
+            except EOFError:
+                return
+            yield from batch
+
+def _spill(iterable, key, reverse, memory_budget, tmpdir, runs):
+    """
+    Sorts the input chunk by chunk, appending each spilled run's path to `runs`.
+    Returns the last chunk, still in memory, or None if it was spilled too.
+    """
+    chunk = []
+    used = 0
+    item_size = None
+    for count, item in enumerate(iterable):
+        if item_size is None or count % _SAMPLE_EVERY == 0:
+            item_size = approx_size(item)
+        chunk.append(item)
+        used += item_size
+        if used >= memory_budget:
+            chunk.sort(key=key, reverse=reverse)
+            runs.append(_write_run(chunk, tmpdir))
+            chunk = []
+            used = 0
+    chunk.sort(key=key, reverse=reverse)
+    if runs and chunk:
+        runs.append(_write_run(chunk, tmpdir))
+        return None
+    return chunk
+
+def _reduce_runs(runs, key, reverse, tmpdir):
+    """Merges runs in consecutive groups until at most MAX_FAN_IN remain."""
+    while len(runs) > MAX_FAN_IN:
+        merged = []
+        for start in range(0, len(runs), MAX_FAN_IN):
+            group = runs[start:start + MAX_FAN_IN]
+            if len(group) == 1:
+                merged.append(group[0])
+                continue
+            items = heapq.merge(*(_read_run(path) for path in group), key=key, reverse=reverse)
+            descriptor, path = tempfile.mkstemp(prefix='user_sort_', suffix='.run', dir=tmpdir)
+            with os.fdopen(descriptor, 'wb') as file:
+                while True:
+                    batch = list(itertools.islice(items, _PICKLE_BATCH))
+                    if not batch:
+                        break
+                    pickle.dump(batch, file, pickle.HIGHEST_PROTOCOL)
+            merged.append(path)
+            for old in group:
+                os.remove(old)
+            # Keep the list current so the caller's cleanup sees only live files
+            runs[start:start + len(group)] = [path] + [None] * (len(group) - 1)
+        runs[:] = merged
+
+def external_sort(iterable, key=None, reverse=False, memory_budget=DEFAULT_MEMORY_BUDGET,
+                  tmpdir=None):
+    """
+    Generator that yields the items of `iterable` sorted by `key`.
+
+    Args:
+        iterable: Items to sort; they must be picklable if the input is spilled.
+        key (callable, optional): Sort key, as for sorted().
+        reverse (bool): Sort in descending order.
+        memory_budget (int): Approximate bytes of items held in memory per run.
+        tmpdir (str, optional): Directory for the run files.
+
+    Input that fits in the budget is sorted in memory and never touches disk.
+    """
+    runs = []
+    try:
+        chunk = _spill(iterable, key, reverse, memory_budget, tmpdir, runs)
+        if chunk is not None:
+            yield from chunk
+            return
+        _reduce_runs(runs, key, reverse, tmpdir)
+        yield from heapq.merge(*(_read_run(path) for path in runs), key=key, reverse=reverse)
+    finally:
+        for path in runs:
+            if path and os.path.exists(path):
+                os.remove(path)
+
+def external_dedupe(iterable, key, memory_budget=DEFAULT_MEMORY_BUDGET, tmpdir=None):
+    """
+    Generator that yields one item per distinct `key`, the first one seen in the
+    input, in key order. Uses external_sort, so memory stays within the budget.
+    """
+    previous = object()
+    for item in external_sort(iterable, key=key, memory_budget=memory_budget, tmpdir=tmpdir):
+        current = key(item)
+        if current != previous:
+            previous = current
+            yield item
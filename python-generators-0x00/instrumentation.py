@@ -0,0 +1,236 @@
+#!/usr/bin/python3
+"""
+Lightweight metrics for the streaming generators.
+
+When enabled (enable(), or STREAM_METRICS=1 in the environment) the
+generators record:
+    fetch_seconds            histogram of database fetch latency, per backend
+    rows_fetched_total       rows returned by the database, per backend
+    connection_wait_seconds  histogram of time spent waiting for a connection
+    rows_yielded_total       rows handed to the consumer, per stream
+    bytes_yielded_total      approximate payload bytes handed to the consumer
+    think_seconds            histogram of consumer time between next() calls
+
+A slow nightly job can then be attributed to the database (fetch_seconds),
+the pool (connection_wait_seconds) or the consumer (think_seconds).
+snapshot() returns everything as a JSON-ready dict and prometheus_text() in
+the Prometheus text exposition format.
+
+When disabled, every hook is a single active() check and instrument()
+returns the stream unchanged, so the generators pay next to nothing.
+"""
+
+import bisect
+import os
+import threading
+import time
+
+import adaptive
+
+PREFIX = 'user_stream_'
+# Upper bounds in seconds; the last bucket (+Inf) is implicit
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5,
+                   1.0, 2.5, 5.0, 10.0)
+
+HELP = {
+    'fetch_seconds': "Database fetch latency in seconds.",
+    'rows_fetched_total': "Rows returned by the database.",
+    'connection_wait_seconds': "Time spent waiting for a database connection in seconds.",
+    'rows_yielded_total': "Rows yielded to the consumer.",
+    'bytes_yielded_total': "Approximate payload bytes yielded to the consumer.",
+    'think_seconds': "Consumer time between next() calls in seconds.",
+}
+
+_enabled = os.getenv('STREAM_METRICS', '').lower() in ('1', 'true', 'yes')
+_lock = threading.Lock()
+_counters = {}
+_histograms = {}
+
+class Histogram:
+    """Fixed-bucket histogram with a running sum and count."""
+
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def cumulative(self):
+        """(upper bound, cumulative count) pairs, ending with ('+Inf', count)."""
+        total = 0
+        pairs = []
+        for bound, count in zip(self.buckets + ('+Inf',), self.counts):
+            total += count
+            pairs.append((bound, total))
+        return pairs
+
+def active():
+    """Whether metrics are being recorded."""
+    return _enabled
+
+def enable():
+    global _enabled
+    _enabled = True
+
+def disable():
+    global _enabled
+    _enabled = False
+
+def reset():
+    """Drops every recorded metric."""
+    with _lock:
+        _counters.clear()
+        _histograms.clear()
+
+def _key(name, labels):
+    return name, tuple(sorted(labels.items()))
+
+def increment(name, amount=1, **labels):
+    """Adds `amount` to a counter (only while active)."""
+    if not _enabled:
+        return
+    key = _key(name, labels)
+    with _lock:
+        _counters[key] = _counters.get(key, 0) + amount
+
+def observe(name, value, **labels):
+    """Records `value` in a histogram (only while active)."""
+    if not _enabled:
+        return
+    key = _key(name, labels)
+    with _lock:
+        histogram = _histograms.get(key)
+        if histogram is None:
+            histogram = _histograms[key] = Histogram()
+        histogram.observe(value)
+
+def _measure(item, batches):
+    """Rows and approximate bytes in a yielded row or batch."""
+    if not batches:
+        return 1, adaptive.row_nbytes(item) if isinstance(item, (dict, tuple, list)) else 0
+    if isinstance(item, list):
+        return len(item), adaptive.page_nbytes(item)
+    import columnar
+    return columnar.batch_length(item), getattr(item, 'nbytes', 0)
+
+_FLUSH_EVERY = 1024 # Items recorded locally before merging into the shared metrics
+
+def _merge(stream, rows, nbytes, think):
+    if not _enabled:
+        return
+    increment('rows_yielded_total', rows, stream=stream)
+    increment('bytes_yielded_total', nbytes, stream=stream)
+    key = _key('think_seconds', {'stream': stream})
+    with _lock:
+        histogram = _histograms.get(key)
+        if histogram is None:
+            histogram = _histograms[key] = Histogram(think.buckets)
+        for index, count in enumerate(think.counts):
+            histogram.counts[index] += count
+        histogram.sum += think.sum
+        histogram.count += think.count
+
+def _instrumented(iterable, stream, batches):
+    # Per-item numbers are kept locally and merged in bulk, so the lock is
+    # taken once per _FLUSH_EVERY items rather than several times per row
+    rows = nbytes = pending = 0
+    think = Histogram()
+    try:
+        for item in iterable:
+            item_rows, item_bytes = _measure(item, batches)
+            rows += item_rows
+            nbytes += item_bytes
+            handed_off = time.perf_counter()
+            yield item
+            think.observe(time.perf_counter() - handed_off)
+            pending += 1
+            if pending == _FLUSH_EVERY:
+                _merge(stream, rows, nbytes, think)
+                rows = nbytes = pending = 0
+                think = Histogram()
+    finally:
+        if rows or think.count:
+            _merge(stream, rows, nbytes, think)
+
+def instrument(iterable, stream, batches=False):
+    """
+    Wraps a stream so that rows, bytes and consumer think-time are recorded
+    under the label stream=`stream`. With batches=True each item is a batch
+    of rows. Returns `iterable` itself when metrics are disabled.
+    """
+    if not _enabled:
+        return iterable
+    return _instrumented(iterable, stream, batches)
+
+def timed(name, call, **labels):
+    """Calls call(), recording its duration in histogram `name`; returns its result."""
+    if not _enabled:
+        return call()
+    start = time.perf_counter()
+    result = call()
+    observe(name, time.perf_counter() - start, **labels)
+    return result
+
+def timed_fetch(fetch, backend):
+    """Calls fetch(), recording its latency and row count; returns its rows."""
+    if not _enabled:
+        return fetch()
+    rows = timed('fetch_seconds', fetch, backend=backend)
+    increment('rows_fetched_total', len(rows), backend=backend)
+    return rows
+
+def snapshot():
+    """Returns the recorded metrics as a JSON-serializable dict."""
+    with _lock:
+        counters = [
+            {'name': name, 'labels': dict(labels), 'value': value}
+            for (name, labels), value in sorted(_counters.items())
+        ]
+        histograms = [
+            {
+                'name': name,
+                'labels': dict(labels),
+                'count': histogram.count,
+                'sum': histogram.sum,
+                'buckets': [[str(bound), count] for bound, count in histogram.cumulative()],
+            }
+            for (name, labels), histogram in sorted(_histograms.items())
+        ]
+    return {'timestamp': time.time(), 'counters': counters, 'histograms': histograms}
+
+def _labels_text(labels, extra=()):
+    pairs = list(labels) + list(extra)
+    if not pairs:
+        return ''
+    escaped = (str(value).replace('\\', '\\\\').replace('"', '\\"') for _, value in pairs)
+    return '{' + ','.join(f'{key}="{value}"' for (key, _), value in zip(pairs, escaped)) + '}'
+
+def prometheus_text():
+    """Returns the recorded metrics in the Prometheus text exposition format."""
+    lines = []
+    with _lock:
+        counters = sorted(_counters.items())
+        histograms = sorted((key, histogram.cumulative(), histogram.sum, histogram.count)
+                            for key, histogram in _histograms.items())
+    seen = set()
+    for (name, labels), value in counters:
+        if name not in seen:
+            seen.add(name)
+            lines.append(f"# HELP {PREFIX}{name} {HELP.get(name, name)}")
+            lines.append(f"# TYPE {PREFIX}{name} counter")
+        lines.append(f"{PREFIX}{name}{_labels_text(labels)} {value}")
+    for (name, labels), buckets, total, count in histograms:
+        if name not in seen:
+            seen.add(name)
+            lines.append(f"# HELP {PREFIX}{name} {HELP.get(name, name)}")
+            lines.append(f"# TYPE {PREFIX}{name} histogram")
+        for bound, cumulative in buckets:
+            lines.append(f"{PREFIX}{name}_bucket{_labels_text(labels, [('le', bound)])} {cumulative}")
+        lines.append(f"{PREFIX}{name}_sum{_labels_text(labels)} {total}")
+        lines.append(f"{PREFIX}{name}_count{_labels_text(labels)} {count}")
+    return '\n'.join(lines) + '\n'
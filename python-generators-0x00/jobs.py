@@ -0,0 +1,176 @@
+#!/usr/bin/python3
+"""
+Resumable batch jobs over user_data.
+
+run_job() pages through user_data with keyset pagination and hands each batch
+to a handler. After the handler returns, the resume token for the position
+after that batch, the batch number and the running stats are committed to a
+local SQLite checkpoint database in one transaction. A job that crashes or is
+killed is rerun under the same name and continues after the last committed
+batch.
+
+Handoff is exactly-once for idempotent consumers: a batch is redelivered only
+if the process died after the handler ran but before its checkpoint was
+committed, and it is redelivered with the same rows and the same batch_id,
+so a consumer that records the batch_ids it has applied can skip it.
+
+    def load(batch, batch_id):
+        warehouse.upsert(batch, batch_id=batch_id)
+
+    run_job('nightly-export', load, batch_size=5000)
+"""
+
+import json
+import sqlite3
+import time
+
+import backends
+import keyset
+from query import UserQuery
+
+DEFAULT_CHECKPOINT_PATH = 'jobs.db'
+
+class CheckpointStore:
+    """Job checkpoints kept in a local SQLite database."""
+
+    def __init__(self, path=DEFAULT_CHECKPOINT_PATH):
+        self.path = path
+        self.connection = sqlite3.connect(path)
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute("PRAGMA synchronous=FULL") # A committed checkpoint survives power loss
+        with self.connection:
+            self.connection.execute("""
+            CREATE TABLE IF NOT EXISTS job_checkpoints (
+                job TEXT PRIMARY KEY,
+                params TEXT NOT NULL,
+                token TEXT,
+                batch_id INTEGER NOT NULL,
+                status TEXT NOT NULL,
+                stats TEXT NOT NULL,
+                updated_at REAL NOT NULL
+            )
+            """)
+
+    def load(self, job):
+        """Returns the checkpoint of `job` as a dict, or None if it has never run."""
+        row = self.connection.execute(
+            "SELECT params, token, batch_id, status, stats, updated_at "
+            "FROM job_checkpoints WHERE job = ?", (job,)
+        ).fetchone()
+        if row is None:
+            return None
+        params, token, batch_id, status, stats, updated_at = row
+        return {
+            'job': job,
+            'params': json.loads(params),
+            'token': token,
+            'batch_id': batch_id,
+            'status': status,
+            'stats': json.loads(stats),
+            'updated_at': updated_at,
+        }
+
+    def save(self, job, params, token, batch_id, status, stats):
+        """Atomically replaces the checkpoint of `job`."""
+        with self.connection:
+            self.connection.execute(
+                "INSERT OR REPLACE INTO job_checkpoints "
+                "(job, params, token, batch_id, status, stats, updated_at) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (job, json.dumps(params, sort_keys=True), token, batch_id, status,
+                 json.dumps(stats), time.time())
+            )
+
+    def reset(self, job):
+        """Forgets `job`, so its next run starts from the beginning."""
+        with self.connection:
+            self.connection.execute("DELETE FROM job_checkpoints WHERE job = ?", (job,))
+
+    def close(self):
+        self.connection.close()
+
+def _job_params(batch_size, key, query):
+    """What must not change between runs for batch boundaries, and so batch_ids, to repeat."""
+    params = {
+        'batch_size': batch_size,
+        'key': key,
+        'columns': list(query.columns),
+        'predicates': [list(predicate) for predicate in query.predicates],
+    }
+    # Round-trip through JSON so the comparison with a stored checkpoint is like for like
+    return json.loads(json.dumps(params, default=str))
+
+def run_job(job, handler, batch_size=1000, key='user_id', query=None,
+            checkpoint_path=DEFAULT_CHECKPOINT_PATH, checkpoint_every=1, restart=False):
+    """
+    Runs `handler(batch, batch_id)` over user_data, resuming from the checkpoint of `job`.
+
+    Args:
+        job (str): Name the checkpoint is stored under.
+        handler (callable): Called with each batch (a list of dict rows) and its
+            1-based batch_id. An exception stops the job; that batch is redelivered
+            on the next run.
+        batch_size (int): Rows fetched per batch.
+        key (str): Column to page on, as in stream_users_in_batches.
+        query (UserQuery, optional): Rows and columns to process.
+        checkpoint_path (str): SQLite file holding the checkpoints.
+        checkpoint_every (int): Batches between checkpoint commits. Above 1, fewer
+            writes are made but up to that many batches may be redelivered.
+        restart (bool): Discard any checkpoint and start from the beginning.
+
+    Returns the job's cumulative stats. A job that already finished returns its
+    stats without running again unless restart=True. Raises ValueError if the
+    checkpoint was written with a different batch_size, key or query, because
+    batch_ids would no longer line up with the earlier run.
+    """
+    if not isinstance(batch_size, int) or batch_size < 1:
+        raise ValueError("batch_size must be a positive int; stable batch_ids need fixed batches.")
+    query = query or UserQuery()
+    params = _job_params(batch_size, key, query)
+    store = CheckpointStore(checkpoint_path)
+    try:
+        if restart:
+            store.reset(job)
+        checkpoint = store.load(job)
+        if checkpoint is not None and checkpoint['params'] != params:
+            raise ValueError(f"Job {job!r} was checkpointed with {checkpoint['params']}; "
+                             "rerun with the same parameters or restart=True.")
+        if checkpoint is not None and checkpoint['status'] == 'done':
+            return checkpoint['stats']
+
+        token = checkpoint['token'] if checkpoint else None
+        batch_id = checkpoint['batch_id'] if checkpoint else 0
+        stats = checkpoint['stats'] if checkpoint else {
+            'batches': 0, 'rows': 0, 'handler_seconds': 0.0, 'runs': 0,
+        }
+        stats['runs'] += 1
+        store.save(job, params, token, batch_id, 'running', stats)
+
+        where, where_params = query.compile()
+        fetch_columns = query.fetch_columns()
+        backend = backends.get_backend()
+        unsaved = 0
+        with backend.connection() as connection:
+            if connection is None:
+                raise RuntimeError("could not connect to the database")
+            pages = keyset.iter_pages(connection, batch_size, key=key, resume_token=token,
+                                      columns=fetch_columns, where=where, params=where_params,
+                                      backend=backend)
+            for page in pages:
+                batch_id += 1
+                batch = query.apply(page, key)
+                if batch: # A page emptied by Python-side filters still uses up its batch_id
+                    started = time.perf_counter()
+                    handler(batch, batch_id)
+                    stats['handler_seconds'] += time.perf_counter() - started
+                    stats['batches'] += 1
+                    stats['rows'] += len(batch)
+                token = keyset.page_token(page, key, fetch_columns)
+                unsaved += 1
+                if unsaved >= checkpoint_every:
+                    store.save(job, params, token, batch_id, 'running', stats)
+                    unsaved = 0
+        store.save(job, params, token, batch_id, 'done', stats)
+        return stats
+    finally:
+        store.close()
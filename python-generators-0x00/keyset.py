@@ -0,0 +1,147 @@
+#!/usr/bin/python3
+"""
+Keyset (seek) pagination helpers for the user_data table.
+
+Instead of LIMIT/OFFSET, every page is fetched with
+    WHERE (key, user_id) > (last_key, last_user_id) ORDER BY key, user_id LIMIT n
+so each page costs the same no matter how deep into the table it is.
+The position after a page can be encoded as an opaque resume token,
+which lets an interrupted scan continue where it left off.
+"""
+
+import base64
+import json
+import re
+import time
+
+import adaptive
+import backends
+import columnar
+
+TABLE = 'user_data'
+COLUMNS = ('user_id', 'name', 'email', 'age')
+# user_id is unique, so it breaks ties when paging on a non-unique column like age
+TIEBREAKER = 'user_id'
+
+_IDENTIFIER = re.compile(r'^[A-Za-z_][A-Za-z0-9_]*$')
+
+def quote_ident(name):
+    """Quotes a column or table name, rejecting anything that is not a plain identifier."""
+    if not isinstance(name, str) or not _IDENTIFIER.match(name):
+        raise ValueError(f"Invalid identifier: {name!r}")
+    return f'"{name}"'
+
+def key_columns(key):
+    """Returns the columns that make up the sort key for paging on `key`."""
+    if key == TIEBREAKER:
+        return (key,)
+    return (key, TIEBREAKER)
+
+def select_columns(columns, key):
+    """Returns `columns` extended with any key column missing from it."""
+    columns = tuple(columns)
+    return columns + tuple(col for col in key_columns(key) if col not in columns)
+
+def encode_token(key, values):
+    """Encodes the last seen key values as an opaque, URL-safe resume token."""
+    payload = json.dumps({'key': key, 'after': list(values)}, default=str)
+    return base64.urlsafe_b64encode(payload.encode('utf-8')).decode('ascii')
+
+def decode_token(token, key):
+    """
+    Decodes a resume token produced by encode_token.
+    Raises ValueError if the token is malformed or was issued for another key.
+    """
+    try:
+        data = json.loads(base64.urlsafe_b64decode(token.encode('ascii')))
+        token_key, after = data['key'], tuple(data['after'])
+    except (ValueError, KeyError, TypeError) as err:
+        raise ValueError(f"Invalid resume token: {err}") from err
+    if token_key != key or len(after) != len(key_columns(key)):
+        raise ValueError(f"Resume token was issued for key '{token_key}', not '{key}'.")
+    return after
+
+def page_query(page_size, key='user_id', after=None, columns=COLUMNS,
+               where=None, params=(), table=TABLE):
+    """
+    Builds the SQL and parameters for one keyset page.
+
+    Args:
+        page_size (int): Maximum number of rows in the page.
+        key (str): Indexed column to page on; user_id is appended as tiebreaker.
+        after (tuple, optional): Key values of the last row of the previous page.
+        columns (tuple): Columns to select; key columns are always included.
+        where (str, optional): Extra filter using %s placeholders.
+        params (tuple): Parameters for `where`.
+    """
+    keys = key_columns(key)
+    select_list = ', '.join(quote_ident(col) for col in select_columns(columns, key))
+    order_by = ', '.join(quote_ident(col) for col in keys)
+
+    conditions = []
+    query_params = []
+    if where:
+        conditions.append(f"({where})")
+        query_params.extend(params)
+    if after is not None:
+        placeholders = ', '.join(['%s'] * len(keys))
+        conditions.append(f"({order_by}) > ({placeholders})")
+        query_params.extend(after)
+
+    sql = f"SELECT {select_list} FROM {quote_ident(table)}"
+    if conditions:
+        sql += " WHERE " + " AND ".join(conditions)
+    sql += f" ORDER BY {order_by} LIMIT %s"
+    query_params.append(int(page_size))
+    return sql, tuple(query_params)
+
+def row_key(row, key='user_id', columns=COLUMNS):
+    """Extracts the key values from a dict row or a tuple row selected with `columns`."""
+    if isinstance(row, dict):
+        return tuple(row[col] for col in key_columns(key))
+    selected = select_columns(columns, key)
+    return tuple(row[selected.index(col)] for col in key_columns(key))
+
+def page_token(page, key='user_id', columns=COLUMNS):
+    """
+    Returns the resume token positioned after the last row of `page`,
+    or None if the page is empty. Accepts row lists as well as columnar
+    batches (NumPy column dicts and Arrow RecordBatches).
+    """
+    if not columnar.batch_length(page):
+        return None
+    if isinstance(page, list):
+        return encode_token(key, row_key(page[-1], key, columns))
+    return encode_token(key, tuple(columnar.last_value(page, col) for col in key_columns(key)))
+
+def fetch_page(connection, page_size, key='user_id', after=None, columns=COLUMNS,
+               where=None, params=(), dict_rows=True, backend=None):
+    """Fetches a single keyset page using `connection` of `backend` (default: the active one)."""
+    backend = backend or backends.get_backend()
+    sql, query_params = page_query(page_size, key, after, columns, where, params)
+    return backend.fetch_all(connection, sql, query_params, dict_rows)
+
+def iter_pages(connection, page_size, key='user_id', resume_token=None, columns=COLUMNS,
+               where=None, params=(), dict_rows=True, backend=None):
+    """
+    Generator that yields consecutive keyset pages over one connection,
+    starting after `resume_token` if one is given. `page_size` is an int or an
+    adaptive.AdaptiveBatchSize, which is asked for the size of every page and
+    told how long each fetch took and how wide its rows were.
+    """
+    sizer = None if isinstance(page_size, int) else page_size
+    after = decode_token(resume_token, key) if resume_token else None
+    while True:
+        size = sizer.size if sizer else page_size
+        if sizer:
+            start = time.perf_counter()
+        page = fetch_page(connection, size, key, after, columns,
+                          where, params, dict_rows, backend)
+        if sizer:
+            sizer.observe(len(page), time.perf_counter() - start, adaptive.page_nbytes(page))
+        if not page:
+            break
+        yield page
+        if len(page) < size:
+            break
+        after = row_key(page[-1], key, columns)
@@ -0,0 +1,151 @@
+#!/usr/bin/python3
+"""
+Parallel range-partitioned scan of the user_data table.
+
+The user_id key space is split into N contiguous UUID ranges. Each range is
+streamed on its own connection (a server-side cursor on PostgreSQL) inside a
+process pool worker. Per-row work runs in the workers, so CPU-heavy
+processing scales across cores. Results are merged back into a single
+generator, either in key order or in arrival order.
+"""
+
+import multiprocessing
+import os
+import queue
+from concurrent.futures import ProcessPoolExecutor
+
+import backends
+from keyset import COLUMNS, quote_ident
+
+_KEY_SPACE = 1 << 32 # Ranges are cut on the first 8 hex digits of the UUID
+
+def partition_bounds(partitions):
+    """
+    Splits the user_id space into `partitions` contiguous (low, high) ranges.
+    low is inclusive and high exclusive; None marks an open end, so every
+    key, valid UUID or not, falls into exactly one range.
+    """
+    if partitions < 1:
+        raise ValueError("partitions must be at least 1.")
+    step = _KEY_SPACE // partitions
+    cuts = [f"{i * step:08x}-0000-0000-0000-000000000000" for i in range(1, partitions)]
+    return list(zip([None] + cuts, cuts + [None]))
+
+def range_query(low, high, columns=COLUMNS, ordered=True):
+    """Returns the SQL and parameters that select one user_id range."""
+    conditions = []
+    params = []
+    if low is not None:
+        conditions.append("user_id >= %s")
+        params.append(low)
+    if high is not None:
+        conditions.append("user_id < %s")
+        params.append(high)
+    sql = f"SELECT {', '.join(quote_ident(col) for col in columns)} FROM user_data"
+    if conditions:
+        sql += " WHERE " + " AND ".join(conditions)
+    if ordered:
+        sql += " ORDER BY user_id"
+    return sql, tuple(params)
+
+def _put(out, item, stop):
+    """Puts onto a bounded queue, giving up once the consumer has stopped."""
+    while not stop.is_set():
+        try:
+            out.put(item, timeout=0.1)
+            return True
+        except queue.Full:
+            continue
+    return False
+
+def _scan_partition(backend, index, low, high, func, ordered, chunk_size, itersize, out, stop):
+    """
+    Worker: streams one key range and sends (index, kind, payload) messages.
+    kind is 'rows' (a list of results), 'done' (row count) or 'error' (message).
+    """
+    sent = 0
+    try:
+        with backend.connection() as connection:
+            if connection is None:
+                raise RuntimeError("could not connect to the database")
+            rows = backend.stream(connection, *range_query(low, high, ordered=ordered),
+                                  itersize=itersize)
+            chunk = []
+            for row in rows:
+                result = func(dict(row)) if func else dict(row)
+                if result is not None:
+                    chunk.append(result)
+                if len(chunk) >= chunk_size:
+                    if not _put(out, (index, 'rows', chunk), stop):
+                        rows.close()
+                        return sent
+                    sent += len(chunk)
+                    chunk = []
+            if chunk and _put(out, (index, 'rows', chunk), stop):
+                sent += len(chunk)
+        _put(out, (index, 'done', sent), stop)
+    except Exception as e:
+        _put(out, (index, 'error', f"{type(e).__name__}: {e}"), stop)
+    return sent
+
+def _drain(out, partitions_left, futures):
+    """Yields results from `out` until `partitions_left` partitions report done."""
+    while partitions_left:
+        try:
+            index, kind, payload = out.get(timeout=1)
+        except queue.Empty:
+            for future in futures:
+                if future.done() and future.exception():
+                    raise RuntimeError(f"Partition worker crashed: {future.exception()}")
+            continue
+        if kind == 'rows':
+            yield from payload
+        elif kind == 'done':
+            partitions_left -= 1
+        else:
+            raise RuntimeError(f"Partition {index} failed: {payload}")
+
+def partitioned_scan(partitions=4, func=None, ordered=False, workers=None,
+                     chunk_size=500, itersize=2000, queue_size=8):
+    """
+    Generator that scans user_data in `partitions` key ranges across a process pool.
+
+    Args:
+        partitions (int): Number of user_id ranges.
+        func (callable, optional): Per-row function run in the workers; it receives
+            the row as a dict and must be picklable (a module-level function).
+            Rows for which it returns None are dropped.
+        ordered (bool): Yield results in user_id order instead of arrival order.
+        workers (int, optional): Worker processes, defaults to min(partitions, CPUs).
+        chunk_size (int): Results sent per inter-process message.
+        itersize (int): Rows per server-side cursor round trip.
+        queue_size (int): Chunks buffered per partition before workers block.
+
+    Raises RuntimeError if a worker fails, rather than yielding a partial scan.
+    """
+    backend = backends.get_backend()
+    bounds = partition_bounds(partitions)
+    workers = workers or min(partitions, os.cpu_count() or 1)
+    manager = multiprocessing.Manager()
+    stop = manager.Event()
+    if ordered:
+        queues = [manager.Queue(queue_size) for _ in bounds]
+    else:
+        queues = [manager.Queue(queue_size * partitions)] * partitions
+    executor = ProcessPoolExecutor(max_workers=workers)
+    try:
+        futures = [
+            executor.submit(_scan_partition, backend, index, low, high, func, ordered,
+                            chunk_size, itersize, queues[index], stop)
+            for index, (low, high) in enumerate(bounds)
+        ]
+        if ordered:
+            # Ranges are disjoint and increasing, so concatenating them keeps key order
+            for index in range(partitions):
+                yield from _drain(queues[index], 1, futures)
+        else:
+            yield from _drain(queues[0], partitions, futures)
+    finally:
+        stop.set()
+        executor.shutdown(wait=True, cancel_futures=True)
+        manager.shutdown()
@@ -0,0 +1,228 @@
+#!/usr/bin/python3
+"""
+Lazy, bounded-memory pipeline combinators for the user streams.
+
+A Pipeline wraps any iterable (usually one of the streaming generators) and
+describes the stages applied to it. Consecutive map and filter stages are
+fused into a single loop, so each row passes through one generator frame no
+matter how many of them are chained. The structural stages (batch, unbatch,
+window, group_by_sorted, take) are also available as plain generator
+functions, and every one of them holds at most a batch, window or group in
+memory. sort and dedupe spill to disk through external_sort.
+
+    domains = (pipe(stream_users())
+               .filter(lambda user: user['age'] >= 18)
+               .map(lambda user: user['email'].rsplit('@', 1)[-1])
+               .batch(1000))
+"""
+
+import itertools
+from collections import deque
+
+from external_sort import DEFAULT_MEMORY_BUDGET, external_dedupe, external_sort
+
+_MAP = 'map'
+_FILTER = 'filter'
+
+def _fused(source, stages):
+    """Applies a run of map/filter stages to every item in one loop."""
+    if len(stages) == 1:
+        kind, function = stages[0]
+        # A single stage needs no Python loop at all
+        return map(function, source) if kind == _MAP else filter(function, source)
+    return _fused_loop(source, stages)
+
+def _fused_loop(source, stages):
+    for item in source:
+        for kind, function in stages:
+            if kind == _MAP:
+                item = function(item)
+            elif not function(item):
+                break
+        else:
+            yield item
+
+def batch(iterable, size):
+    """Generator of lists of up to `size` consecutive items."""
+    if size < 1:
+        raise ValueError("size must be at least 1.")
+    iterator = iter(iterable)
+    while True:
+        chunk = list(itertools.islice(iterator, size))
+        if not chunk:
+            return
+        yield chunk
+
+def unbatch(iterable):
+    """Generator that flattens an iterable of batches back into items."""
+    return itertools.chain.from_iterable(iterable)
+
+def window(iterable, size, step=1, key=None):
+    """
+    Generator of sliding windows, as tuples.
+
+    Without `key`, each window holds `size` consecutive items and the window
+    advances `step` items at a time; a trailing partial window is not emitted.
+    With `key` (for example an ingestion timestamp), windows are by value:
+    every `step` items a window is emitted holding the items whose key lies
+    within `size` of the newest item's key. Keys must be non-decreasing.
+    """
+    if step < 1:
+        raise ValueError("step must be at least 1.")
+    if key is None:
+        if size < 1:
+            raise ValueError("size must be at least 1.")
+        current = deque(maxlen=size)
+        pending = size
+        for item in iterable:
+            current.append(item)
+            pending -= 1
+            if pending == 0:
+                yield tuple(current)
+                pending = step
+        return
+
+    current = deque()
+    since = 0
+    for item in iterable:
+        newest = key(item)
+        current.append((newest, item))
+        while newest - current[0][0] > size:
+            current.popleft()
+        since += 1
+        if since == step:
+            yield tuple(entry for _, entry in current)
+            since = 0
+
+def group_by_sorted(iterable, key=None):
+    """
+    Generator of (key, items) pairs for runs of items with equal keys.
+    The input must already be sorted (or clustered) by `key`; only the
+    current group is held in memory.
+    """
+    for group_key, items in itertools.groupby(iterable, key):
+        yield group_key, list(items)
+
+def take(iterable, n):
+    """Generator of at most the first `n` items."""
+    return itertools.islice(iterable, n)
+
+class _TeeState:
+    """Source iterator and per-consumer buffers shared by the branches of a tee."""
+
+    def __init__(self, iterable, n, maxsize):
+        self.source = iter(iterable)
+        self.buffers = [deque() for _ in range(n)]
+        self.maxsize = maxsize
+        self.done = False
+
+    def next_for(self, index):
+        buffer = self.buffers[index]
+        if buffer:
+            return buffer.popleft()
+        if self.done:
+            raise StopIteration
+        others = [other for position, other in enumerate(self.buffers) if position != index]
+        if any(len(other) >= self.maxsize for other in others):
+            raise BufferError(
+                f"tee branch {index} is more than {self.maxsize} items ahead of another branch."
+            )
+        try:
+            item = next(self.source)
+        except StopIteration:
+            self.done = True
+            raise
+        for other in others:
+            other.append(item)
+        return item
+
+def _tee_branch(state, index):
+    while True:
+        try:
+            item = state.next_for(index)
+        except StopIteration:
+            return
+        yield item
+
+def tee(iterable, n=2, maxsize=1000):
+    """
+    Splits `iterable` into `n` independent iterators, like itertools.tee,
+    but with at most `maxsize` items buffered for a lagging branch. A branch
+    that would run further ahead raises BufferError instead of letting the
+    buffer grow without bound.
+    """
+    if n < 1:
+        raise ValueError("n must be at least 1.")
+    state = _TeeState(iterable, n, maxsize)
+    return tuple(_tee_branch(state, index) for index in range(n))
+
+class Pipeline:
+    """
+    An immutable chain of stages over a source iterable. Every method returns a
+    new Pipeline; nothing runs until the pipeline is iterated.
+    """
+
+    def __init__(self, source, stages=()):
+        """
+        Args:
+            source (iterable): Items to process.
+            stages (tuple): Pending (kind, function) map/filter stages, fused on iteration.
+        """
+        self.source = source
+        self.stages = tuple(stages)
+
+    def _then(self, kind, function):
+        return Pipeline(self.source, self.stages + ((kind, function),))
+
+    def _through(self, function, *args, **kwargs):
+        """Materializes the pending stages and applies a structural stage."""
+        return Pipeline(function(iter(self), *args, **kwargs))
+
+    def map(self, function):
+        """Returns a pipeline that applies `function` to every item."""
+        return self._then(_MAP, function)
+
+    def filter(self, predicate):
+        """Returns a pipeline that keeps the items for which `predicate` is true."""
+        return self._then(_FILTER, predicate)
+
+    def batch(self, size):
+        """Returns a pipeline of lists of up to `size` items."""
+        return self._through(batch, size)
+
+    def unbatch(self):
+        """Returns a pipeline that flattens batches into items."""
+        return self._through(unbatch)
+
+    def window(self, size, step=1, key=None):
+        """Returns a pipeline of sliding windows; see window()."""
+        return self._through(window, size, step, key)
+
+    def group_by_sorted(self, key=None):
+        """Returns a pipeline of (key, items) runs; see group_by_sorted()."""
+        return self._through(group_by_sorted, key)
+
+    def take(self, n):
+        """Returns a pipeline of at most the first `n` items."""
+        return self._through(take, n)
+
+    def sort(self, key=None, reverse=False, memory_budget=DEFAULT_MEMORY_BUDGET):
+        """Returns a sorted pipeline, spilling to disk beyond `memory_budget` bytes."""
+        return self._through(external_sort, key, reverse, memory_budget)
+
+    def dedupe(self, key, memory_budget=DEFAULT_MEMORY_BUDGET):
+        """Returns a pipeline with one item per distinct `key`, in key order."""
+        return self._through(external_dedupe, key, memory_budget)
+
+    def tee(self, n=2, maxsize=1000):
+        """Returns `n` pipelines reading the same items through bounded buffers."""
+        return tuple(Pipeline(branch) for branch in tee(iter(self), n, maxsize))
+
+    def __iter__(self):
+        if not self.stages:
+            return iter(self.source)
+        return _fused(self.source, self.stages)
+
+def pipe(source):
+    """Starts a Pipeline over `source`."""
+    return Pipeline(source)
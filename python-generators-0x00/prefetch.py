@@ -0,0 +1,67 @@
+#!/usr/bin/python3
+"""
+Read-ahead wrapper that overlaps producing items with consuming them.
+
+A background thread pulls items from the source iterator into a bounded
+queue, so the next database page is already being fetched while the caller
+processes the current one. The bound gives backpressure. When the consumer
+stops early (break, an exception such as BrokenPipeError, or garbage
+collection), the thread is told to stop and the source is closed cleanly.
+"""
+
+import queue
+import threading
+
+_DONE = object()
+
+def _put(buffer, item, stop, poll_interval):
+    """Blocks until `item` is queued or the consumer has gone away."""
+    while not stop.is_set():
+        try:
+            buffer.put(item, timeout=poll_interval)
+            return True
+        except queue.Full:
+            continue
+    return False
+
+def read_ahead(iterable, depth=2, poll_interval=0.1):
+    """
+    Generator that yields the items of `iterable`, fetching up to `depth`
+    items ahead on a background thread. depth < 1 disables the read-ahead.
+    Exceptions raised by the source are re-raised in the consumer.
+    """
+    if depth < 1:
+        yield from iterable
+        return
+
+    buffer = queue.Queue(maxsize=depth)
+    stop = threading.Event()
+
+    def produce():
+        source = iter(iterable)
+        try:
+            for item in source:
+                if not _put(buffer, (True, item), stop, poll_interval):
+                    return
+            _put(buffer, (True, _DONE), stop, poll_interval)
+        except Exception as e:
+            _put(buffer, (False, e), stop, poll_interval)
+        finally:
+            # Run the source's own cleanup (e.g. returning pooled connections) on this thread
+            close = getattr(source, 'close', None)
+            if close:
+                close()
+
+    thread = threading.Thread(target=produce, name='read-ahead', daemon=True)
+    thread.start()
+    try:
+        while True:
+            ok, item = buffer.get()
+            if not ok:
+                raise item
+            if item is _DONE:
+                return
+            yield item
+    finally:
+        stop.set()
+        thread.join()
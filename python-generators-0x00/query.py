@@ -0,0 +1,133 @@
+#!/usr/bin/python3
+"""
+Composable query builder for scans over the user_data table.
+
+Predicates and column projections declared on a UserQuery are compiled into
+the SQL WHERE clause and SELECT list, so only matching rows and the needed
+columns are sent by the server. Predicates that cannot be expressed in SQL
+(plain Python callables) are evaluated on the fetched rows instead.
+"""
+
+import operator
+
+import keyset
+
+# SQL operators that can be pushed down, with their Python equivalents
+_SQL_OPERATORS = {
+    '=': operator.eq,
+    '!=': operator.ne,
+    '<>': operator.ne,
+    '<': operator.lt,
+    '<=': operator.le,
+    '>': operator.gt,
+    '>=': operator.ge,
+    'in': lambda value, options: value in options,
+    'not in': lambda value, options: value not in options,
+    'is null': lambda value, _: value is None,
+    'is not null': lambda value, _: value is not None,
+}
+
+class UserQuery:
+    """
+    An immutable description of a user_data scan: a projection plus predicates.
+    Every builder method returns a new UserQuery, so queries can be shared and extended.
+    """
+
+    def __init__(self, columns=keyset.COLUMNS, predicates=(), python_filters=()):
+        """
+        Args:
+            columns (tuple): Columns to return.
+            predicates (tuple): (column, operator, value) triples pushed down to SQL.
+            python_filters (tuple): (callable, columns) pairs evaluated on fetched rows.
+        """
+        for column in columns:
+            keyset.quote_ident(column)
+        self.columns = tuple(columns)
+        self.predicates = tuple(predicates)
+        self.python_filters = tuple(python_filters)
+
+    def select(self, *columns):
+        """Returns a query that only returns `columns`."""
+        return UserQuery(columns, self.predicates, self.python_filters)
+
+    def where(self, column, op, value=None):
+        """
+        Returns a query that also requires `column op value`.
+        String operators ('=', '>', 'in', 'is null', ...) are pushed down to SQL;
+        a callable `op` is applied to the column value in Python instead.
+        """
+        keyset.quote_ident(column)
+        if callable(op):
+            check = lambda row, fn=op: fn(row[column])
+            return self.filter(check, columns=(column,))
+        op = op.lower()
+        if op not in _SQL_OPERATORS:
+            raise ValueError(f"Unsupported operator: {op!r}")
+        if op in ('in', 'not in'):
+            value = tuple(value)
+        return UserQuery(self.columns, self.predicates + ((column, op, value),),
+                         self.python_filters)
+
+    def filter(self, predicate, columns=keyset.COLUMNS):
+        """
+        Returns a query that also requires predicate(row) to be true.
+        The predicate runs in Python on fetched rows; `columns` lists the
+        columns it reads so they are fetched even if not selected.
+        """
+        return UserQuery(self.columns, self.predicates,
+                         self.python_filters + ((predicate, tuple(columns)),))
+
+    def fetch_columns(self):
+        """Columns that must come over the wire: the projection plus Python filter inputs."""
+        columns = list(self.columns)
+        for _, needed in self.python_filters:
+            columns.extend(col for col in needed if col not in columns)
+        return tuple(columns)
+
+    def compile(self):
+        """
+        Compiles the pushed-down predicates.
+        Returns a (where, params) pair using %s placeholders, or (None, ()) if there are none.
+        """
+        clauses = []
+        params = []
+        for column, op, value in self.predicates:
+            name = keyset.quote_ident(column)
+            if op in ('is null', 'is not null'):
+                clauses.append(f"{name} {op.upper()}")
+            elif op in ('in', 'not in'):
+                if not value:
+                    # An empty IN list matches nothing; an empty NOT IN matches everything
+                    clauses.append("FALSE" if op == 'in' else "TRUE")
+                else:
+                    placeholders = ', '.join(['%s'] * len(value))
+                    clauses.append(f"{name} {op.upper()} ({placeholders})")
+                    params.extend(value)
+            else:
+                clauses.append(f"{name} {op} %s")
+                params.append(value)
+        if not clauses:
+            return None, ()
+        return ' AND '.join(clauses), tuple(params)
+
+    def matches(self, row):
+        """Evaluates every predicate in Python; used for rows from non-SQL sources."""
+        for column, op, value in self.predicates:
+            if row[column] is None and op not in ('is null', 'is not null'):
+                return False
+            if not _SQL_OPERATORS[op](row[column], value):
+                return False
+        return all(predicate(row) for predicate, _ in self.python_filters)
+
+    def apply(self, rows, key='user_id'):
+        """
+        Applies the Python-only filters to fetched dict rows and trims them
+        to the projection (key columns are kept so paging can resume).
+        """
+        keep = keyset.select_columns(self.columns, key)
+        trim = set(keep) != set(keyset.select_columns(self.fetch_columns(), key))
+        result = []
+        for row in rows:
+            if all(predicate(row) for predicate, _ in self.python_filters):
+                result.append({col: row[col] for col in keep} if trim else row)
+        return result
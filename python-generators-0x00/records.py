@@ -0,0 +1,205 @@
+#!/usr/bin/python3
+"""
+Compact in-memory representations of user_data rows.
+
+A RealDictCursor row carries its own dict with the column names as keys,
+which is several times larger than the values it holds. UserRecord stores a
+row in fixed __slots__ instead, and still supports record['age'] so code
+written against dict rows keeps working. UserBatch stores a whole batch
+column by column: user_ids as 16-byte binary UUIDs in one bytearray, numeric
+columns in array('d') and text columns as lists of interned strings. Buffered
+batches then take a fraction of the memory of a list of dicts.
+"""
+
+import sys
+import uuid
+from array import array
+
+from columnar import COLUMN_TYPES
+from keyset import COLUMNS
+
+class UserRecord:
+    """A user_data row with attribute and item access and no per-row dict."""
+
+    __slots__ = COLUMNS
+
+    def __init__(self, user_id=None, name=None, email=None, age=None):
+        self.user_id = user_id
+        self.name = name
+        self.email = email
+        self.age = age
+
+    @classmethod
+    def from_row(cls, row, columns=COLUMNS):
+        """Builds a record from a dict row or a tuple row in `columns` order."""
+        if isinstance(row, dict):
+            return cls(**{column: row.get(column) for column in COLUMNS})
+        return cls(**dict(zip(columns, row)))
+
+    def __getitem__(self, column):
+        try:
+            return getattr(self, column)
+        except (AttributeError, TypeError):
+            raise KeyError(column) from None
+
+    def get(self, column, default=None):
+        return getattr(self, column, default)
+
+    def keys(self):
+        return COLUMNS
+
+    def _asdict(self):
+        return {column: getattr(self, column) for column in COLUMNS}
+
+    def __iter__(self):
+        return (getattr(self, column) for column in COLUMNS)
+
+    def __eq__(self, other):
+        if not isinstance(other, UserRecord):
+            return NotImplemented
+        return tuple(self) == tuple(other)
+
+    def __repr__(self):
+        fields = ', '.join(f"{column}={getattr(self, column)!r}" for column in COLUMNS)
+        return f"UserRecord({fields})"
+
+def _pack_uuid(value):
+    """
+    The 16 bytes of a user_id that decodes back to exactly the same value, else None.
+    Upper-case or brace-wrapped ids from VARCHAR tables are not packed, so
+    last_value and page_token return them as stored and resume at the right key.
+    """
+    if isinstance(value, uuid.UUID):
+        return value.bytes
+    try:
+        parsed = uuid.UUID(value)
+    except (ValueError, TypeError, AttributeError):
+        return None
+    return parsed.bytes if str(parsed) == value else None
+
+class _UUIDColumn:
+    """Read-only sequence view that decodes the packed user_ids of a UserBatch."""
+
+    def __init__(self, batch):
+        self._batch = batch
+
+    def __len__(self):
+        return len(self._batch)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(len(self)))]
+        return self._batch._user_id(index)
+
+class UserBatch:
+    """
+    An append-only batch of rows stored column by column.
+
+    user_id values in canonical UUID form are packed into 16 bytes; anything
+    else, including other spellings of a UUID, is kept as given on the side, so
+    odd legacy keys round-trip unchanged.
+    """
+
+    def __init__(self, columns=COLUMNS):
+        unknown = [column for column in columns if column not in COLUMN_TYPES]
+        if unknown:
+            raise ValueError(f"Unknown user_data columns: {', '.join(unknown)}")
+        self.columns = tuple(columns)
+        self._length = 0
+        self._data = {}
+        for column in self.columns:
+            if column == 'user_id':
+                self._data[column] = bytearray()
+            elif COLUMN_TYPES[column] is float:
+                self._data[column] = array('d')
+            else:
+                self._data[column] = []
+        self._odd_ids = {} # row index -> user_id that is not a UUID
+
+    @classmethod
+    def from_rows(cls, rows, columns=COLUMNS):
+        """Builds a batch from tuple rows in `columns` order, or from dict rows."""
+        batch = cls(columns)
+        batch.extend(rows)
+        return batch
+
+    def append(self, row):
+        if isinstance(row, dict):
+            values = [row.get(column) for column in self.columns]
+        else:
+            values = row
+        for column, value in zip(self.columns, values):
+            data = self._data[column]
+            if column == 'user_id':
+                packed = _pack_uuid(value)
+                if packed is None:
+                    data += bytes(16)
+                    self._odd_ids[self._length] = value
+                else:
+                    data += packed
+            elif isinstance(data, array):
+                data.append(float('nan') if value is None else float(value))
+            else:
+                data.append(sys.intern(value) if isinstance(value, str) else value)
+        self._length += 1
+
+    def extend(self, rows):
+        for row in rows:
+            self.append(row)
+
+    def __len__(self):
+        return self._length
+
+    def _user_id(self, index):
+        if index < 0:
+            index += self._length
+        if not 0 <= index < self._length:
+            raise IndexError("UserBatch index out of range")
+        if index in self._odd_ids:
+            return self._odd_ids[index]
+        packed = self._data['user_id']
+        return str(uuid.UUID(bytes=bytes(packed[index * 16:index * 16 + 16])))
+
+    def column(self, name):
+        """
+        The values of one column: an array('d') for numeric columns, a list for
+        text columns and a decoding sequence view for user_id.
+        """
+        if name not in self._data:
+            raise KeyError(name)
+        if name == 'user_id':
+            return _UUIDColumn(self)
+        return self._data[name]
+
+    def record(self, index):
+        """Row `index` as a UserRecord (columns not in the batch are None)."""
+        if index < 0:
+            index += self._length
+        if not 0 <= index < self._length:
+            raise IndexError("UserBatch index out of range")
+        values = {}
+        for column in self.columns:
+            if column == 'user_id':
+                values[column] = self._user_id(index)
+            else:
+                values[column] = self._data[column][index]
+        return UserRecord(**values)
+
+    def __getitem__(self, key):
+        """batch[i] is a UserRecord; batch['age'] is the age column."""
+        if isinstance(key, str):
+            return self.column(key)
+        return self.record(key)
+
+    def __iter__(self):
+        return (self.record(index) for index in range(self._length))
+
+    @property
+    def nbytes(self):
+        """Approximate memory held by the batch's column storage."""
+        size = 0
+        for data in self._data.values():
+            size += sys.getsizeof(data)
+            if isinstance(data, list):
+                size += sum(sys.getsizeof(value) for value in data)
+        return size
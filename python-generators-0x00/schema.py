@@ -0,0 +1,267 @@
+#!/usr/bin/python3
+"""
+Schema upgrade and index advisor for user_data (PostgreSQL).
+
+migrate() converts a table created with the original schema
+(user_id VARCHAR(36)) to user_id UUID, a 16-byte fixed-width key that
+compares as two machine words.
+
+age stays NUMERIC(5, 2). Resume tokens, sync hashes and query parameters all
+carry ages as exact decimals; a float4 column would compare 40.1 as
+40.09999847 against them and skip or repeat rows tied at a page boundary.
+A table whose age was converted to REAL by an earlier migrate() is converted
+back. All pending columns are converted in one table rewrite.
+
+advise() runs EXPLAIN on the queries the generators issue, proposes an index
+for every sequential scan filter or sort it finds on user_data, optionally
+creates them with CREATE INDEX CONCURRENTLY, and reports each query's
+execution time before and after.
+
+Usage:
+    ./schema.py migrate [--repair]
+    ./schema.py advise [--apply] [--runs 3]
+"""
+
+import argparse
+import json
+import re
+
+import seed
+from keyset import COLUMNS, page_query
+from query import UserQuery
+
+TABLE = 'user_data'
+# column -> (information_schema data_type, type to convert to)
+TARGET_TYPES = {'user_id': ('uuid', 'uuid'), 'age': ('numeric', 'numeric(5, 2)')}
+
+_NIL_UUID = '00000000-0000-0000-0000-000000000000'
+_UUID_PATTERN = '^[0-9a-fA-F]{8}-[0-9a-fA-F]{4}-[0-9a-fA-F]{4}-[0-9a-fA-F]{4}-[0-9a-fA-F]{12}$'
+
+def column_types(connection):
+    """Returns {column: data type} for user_data, e.g. {'user_id': 'character varying'}."""
+    cursor = connection.cursor()
+    try:
+        cursor.execute(
+            "SELECT column_name, data_type FROM information_schema.columns "
+            "WHERE table_schema = current_schema() AND table_name = %s",
+            (TABLE,)
+        )
+        return dict(cursor.fetchall())
+    finally:
+        cursor.close()
+
+def _repair_invalid_ids(cursor, repair):
+    """Finds user_ids that are not UUIDs and, with `repair`, replaces them."""
+    cursor.execute(f"SELECT user_id, name, email FROM {TABLE} WHERE user_id !~ %s",
+                   (_UUID_PATTERN,))
+    invalid = cursor.fetchall()
+    if invalid and not repair:
+        raise ValueError(f"{len(invalid)} user_ids are not UUIDs (e.g. {invalid[0][0]!r}); "
+                         "rerun with repair=True to replace them.")
+    for user_id, name, email in invalid:
+        # Same stable replacement as seed.sync_data, so a later sync matches these rows
+        cursor.execute(f"UPDATE {TABLE} SET user_id = %s WHERE user_id = %s",
+                       (seed.repair_user_id(user_id, f"{name}|{email}"), user_id))
+    return len(invalid)
+
+def migrate(connection, repair=False):
+    """
+    Converts user_id to UUID (and a REAL age back to NUMERIC(5, 2)), in one transaction.
+    The ALTER rewrites the table under an exclusive lock, so run it in a quiet window.
+    Returns a dict describing what changed.
+    """
+    types = column_types(connection)
+    if not types:
+        raise ValueError(f"Table {TABLE} does not exist.")
+    pending = {column: target for column, (data_type, target) in TARGET_TYPES.items()
+               if types.get(column) != data_type}
+    result = {'altered': sorted(pending), 'repaired_ids': 0}
+    if not pending:
+        print("user_data already uses the native column types.")
+        return result
+
+    cursor = connection.cursor()
+    try:
+        if 'user_id' in pending:
+            result['repaired_ids'] = _repair_invalid_ids(cursor, repair)
+        clauses = [f"ALTER COLUMN {column} TYPE {target} USING {column}::{target}"
+                   for column, target in pending.items()]
+        cursor.execute(f"ALTER TABLE {TABLE} " + ", ".join(clauses))
+        if 'user_id' in pending:
+            # Keep an in-progress sync's seen-id table joinable with the new key type
+            cursor.execute("SELECT to_regclass(%s)", (seed.SYNC_SEEN_TABLE,))
+            if cursor.fetchone()[0] is not None:
+                cursor.execute(f"ALTER TABLE {seed.SYNC_SEEN_TABLE} "
+                               "ALTER COLUMN user_id TYPE uuid USING user_id::uuid")
+        connection.commit()
+        cursor.execute(f"ANALYZE {TABLE}")
+        connection.commit()
+        print(f"Migrated user_data columns: {', '.join(result['altered'])}.")
+        return result
+    except Exception:
+        connection.rollback()
+        raise
+    finally:
+        cursor.close()
+
+def generator_queries():
+    """Returns (name, sql, params) for the queries the generators issue."""
+    over_25 = UserQuery().where('age', '>', 25)
+    where, params = over_25.compile()
+    return [
+        ('stream_users', "SELECT user_id, name, email, age FROM user_data", ()),
+        ('stream_user_ages', "SELECT age FROM user_data", ()),
+        ('batch_processing page', *page_query(1000, where=where, params=params)),
+        ('batches keyed on age', *page_query(1000, key='age', after=(40.0, _NIL_UUID))),
+        ('lookup by email', "SELECT user_id, name, email, age FROM user_data WHERE email = %s",
+         ('nobody@example.com',)),
+    ]
+
+def _explain(cursor, sql, params, analyze=False):
+    options = "ANALYZE, FORMAT JSON" if analyze else "FORMAT JSON"
+    cursor.execute(f"EXPLAIN ({options}) {sql}", params)
+    plan = cursor.fetchone()[0]
+    if isinstance(plan, str):
+        plan = json.loads(plan)
+    return plan[0]
+
+def _nodes(plan):
+    yield plan
+    for child in plan.get('Plans', ()):
+        yield from _nodes(child)
+
+def _columns_in(expression):
+    """user_data columns mentioned in a plan expression, in order of appearance."""
+    found = []
+    for match in re.finditer(r'[A-Za-z_][A-Za-z0-9_]*', expression or ''):
+        name = match.group(0)
+        if name in COLUMNS and name not in found:
+            found.append(name)
+    return found
+
+def propose_indexes(plan):
+    """
+    Returns column tuples worth indexing for one query plan: the sort key of
+    a Sort above a user_data scan, else the filter columns of a sequential scan.
+    """
+    proposals = []
+    nodes = list(_nodes(plan['Plan']))
+    scans = [node for node in nodes
+             if node.get('Node Type') == 'Seq Scan' and node.get('Relation Name') == TABLE]
+    if not scans:
+        return proposals
+    for node in nodes:
+        if node.get('Node Type') in ('Sort', 'Incremental Sort'):
+            columns = []
+            for key in node.get('Sort Key', ()):
+                columns += [column for column in _columns_in(key) if column not in columns]
+            if columns and columns != ['user_id']:
+                proposals.append(tuple(columns))
+    if not proposals:
+        for scan in scans:
+            columns = tuple(_columns_in(scan.get('Filter')))
+            if columns and columns != ('user_id',):
+                proposals.append(columns)
+    return proposals
+
+def existing_indexes(connection):
+    """Returns the column tuples of the indexes already on user_data."""
+    cursor = connection.cursor()
+    try:
+        cursor.execute(
+            "SELECT array_agg(a.attname::text ORDER BY k.position) "
+            "FROM pg_index i "
+            "CROSS JOIN LATERAL unnest(i.indkey) WITH ORDINALITY AS k(attnum, position) "
+            "JOIN pg_attribute a ON a.attrelid = i.indrelid AND a.attnum = k.attnum "
+            "WHERE i.indrelid = %s::regclass GROUP BY i.indexrelid",
+            (TABLE,)
+        )
+        return {tuple(row[0]) for row in cursor.fetchall()}
+    finally:
+        cursor.close()
+
+def _covered(columns, indexes):
+    """Whether an existing index starts with `columns`."""
+    return any(index[:len(columns)] == columns for index in indexes)
+
+def _timings(cursor, queries, runs):
+    """Median server execution time in ms of each query, from EXPLAIN ANALYZE."""
+    timings = {}
+    for name, sql, params in queries:
+        samples = sorted(_explain(cursor, sql, params, analyze=True)['Execution Time']
+                         for _ in range(runs))
+        timings[name] = round(samples[len(samples) // 2], 3)
+    return timings
+
+def advise(connection, apply=False, runs=3):
+    """
+    Proposes indexes for the generator queries and, with `apply`, creates them.
+
+    CREATE INDEX CONCURRENTLY cannot run inside a transaction, so `connection`
+    is switched to autocommit for the duration of the call and restored after.
+    Returns a report dict with the proposals and per-query timings before and
+    (with `apply`) after.
+    """
+    autocommit = connection.autocommit
+    connection.autocommit = True
+    cursor = connection.cursor()
+    try:
+        queries = generator_queries()
+        indexes = existing_indexes(connection)
+        proposals = []
+        plans = {}
+        for name, sql, params in queries:
+            plan = _explain(cursor, sql, params)
+            plans[name] = plan['Plan']['Node Type']
+            for columns in propose_indexes(plan):
+                if not _covered(columns, indexes) and columns not in proposals:
+                    proposals.append(columns)
+        report = {
+            'plans_before': plans,
+            'proposed': [
+                {'columns': list(columns), 'name': f"{TABLE}_{'_'.join(columns)}_idx"}
+                for columns in proposals
+            ],
+            'before_ms': _timings(cursor, queries, runs),
+        }
+        if not apply or not proposals:
+            return report
+        for index in report['proposed']:
+            print(f"Creating index {index['name']} on ({', '.join(index['columns'])})...")
+            cursor.execute(f"CREATE INDEX CONCURRENTLY IF NOT EXISTS {index['name']} "
+                           f"ON {TABLE} ({', '.join(index['columns'])})")
+        cursor.execute(f"ANALYZE {TABLE}")
+        report['plans_after'] = {name: _explain(cursor, sql, params)['Plan']['Node Type']
+                                 for name, sql, params in queries}
+        report['after_ms'] = _timings(cursor, queries, runs)
+        return report
+    finally:
+        cursor.close()
+        connection.autocommit = autocommit
+
+def main():
+    parser = argparse.ArgumentParser(description="Upgrade the user_data schema and indexes.")
+    commands = parser.add_subparsers(dest='command', required=True)
+    migrate_parser = commands.add_parser('migrate', help="Convert user_id to UUID.")
+    migrate_parser.add_argument('--repair', action='store_true',
+                                help="Replace user_ids that are not UUIDs instead of aborting.")
+    advise_parser = commands.add_parser('advise', help="Propose (and create) indexes.")
+    advise_parser.add_argument('--apply', action='store_true',
+                               help="Create the proposed indexes concurrently.")
+    advise_parser.add_argument('--runs', type=int, default=3,
+                               help="EXPLAIN ANALYZE runs per query for the timings.")
+    args = parser.parse_args()
+
+    connection = seed.connect_to_prodev()
+    if connection is None:
+        return
+    try:
+        if args.command == 'migrate':
+            print(json.dumps(migrate(connection, args.repair), indent=2))
+        else:
+            print(json.dumps(advise(connection, args.apply, args.runs), indent=2))
+    finally:
+        connection.close()
+
+if __name__ == '__main__':
+    main()
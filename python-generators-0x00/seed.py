@@ -1,12 +1,26 @@
 #!/usr/bin/python3
 
 import psycopg2
+from psycopg2 import extensions
+from psycopg2.pool import PoolError
 from psycopg2.extras import RealDictCursor # To fetch rows as dictionaries
+from psycopg2.extras import execute_values
+import atexit
+import collections
 import csv
+import hashlib
+import json
+import threading
 import uuid
 import os
+import time
+from contextlib import contextmanager
+from decimal import Decimal, ROUND_HALF_UP
 from dotenv import load_dotenv
 
+import csv_ingest
+import instrumentation
+
 load_dotenv()
 
 DB_HOST = os.getenv('DB_HOST')
@@ -15,6 +29,11 @@ DB_PASSWORD = os.getenv('DB_PASSWORD')
 DB_NAME = os.getenv('DB_NAME')
 DB_PORT = os.getenv('DB_PORT', 5432) # Default to 5432 if not set
 
+# Connection pool settings used by the generators
+DB_POOL_MIN = int(os.getenv('DB_POOL_MIN', 1))
+DB_POOL_MAX = int(os.getenv('DB_POOL_MAX', 10))
+DB_POOL_IDLE_TIMEOUT = float(os.getenv('DB_POOL_IDLE_TIMEOUT', 300)) # Seconds
+
 def connect_db():
     """
     Connects to the PostgreSQL database server (to the default 'postgres' database initially).
@@ -70,12 +89,263 @@ def connect_to_prodev():
         print(f"Error connecting to {DB_NAME}: {err}")
         return None
 
+class ConnectionPool:
+    """
+    A thread-safe pool of connections to the ALX_prodev database.
+
+    Connections are health checked when they are checked out, idle ones beyond
+    `minconn` are closed after `idle_timeout` seconds, and checkouts block for up
+    to `checkout_timeout` seconds once `maxconn` connections are in use.
+    """
+
+    def __init__(self, minconn=DB_POOL_MIN, maxconn=DB_POOL_MAX,
+                 idle_timeout=DB_POOL_IDLE_TIMEOUT, checkout_timeout=30,
+                 ping_after=30, connect=None):
+        """
+        Initializes the pool and opens `minconn` connections up front.
+
+        Args:
+            minconn (int): Connections kept open even when idle.
+            maxconn (int): Upper bound on open connections.
+            idle_timeout (float): Seconds before a surplus idle connection is closed.
+            checkout_timeout (float): Seconds to wait for a free connection.
+            ping_after (float): Idle seconds after which checkout runs SELECT 1.
+            connect (callable, optional): Connection factory, defaults to connect_to_prodev.
+        """
+        if minconn < 0 or maxconn < 1 or minconn > maxconn:
+            raise ValueError("Pool sizes must satisfy 0 <= minconn <= maxconn and maxconn >= 1.")
+        self.minconn = minconn
+        self.maxconn = maxconn
+        self.idle_timeout = idle_timeout
+        self.checkout_timeout = checkout_timeout
+        self.ping_after = ping_after
+        self.connect = connect or connect_to_prodev
+        self._idle = collections.deque() # (connection, returned_at), most recent on the right
+        self._open = set() # Every connection opened by this process and not yet closed
+        self._inherited = set() # Connections opened by a parent process before a fork
+        self._size = 0 # Open connections, idle or checked out
+        self._cond = threading.Condition()
+        self._pid = os.getpid()
+        self._closed = False
+        for _ in range(minconn):
+            connection = self.connect()
+            if connection:
+                self._open.add(connection)
+                self._size += 1
+                self._idle.append((connection, time.monotonic()))
+
+    def getconn(self):
+        """
+        Checks out a healthy connection, opening a new one if the pool is not full.
+        Returns None if a new connection could not be established.
+        Raises PoolError if no connection frees up within checkout_timeout.
+        """
+        if self._closed:
+            raise PoolError("Connection pool is closed.")
+        self._check_fork()
+        deadline = time.monotonic() + self.checkout_timeout
+        while True:
+            with self._cond:
+                self._reap_idle()
+                candidate = None
+                if self._idle:
+                    candidate = self._idle.pop()
+                elif self._size < self.maxconn:
+                    self._size += 1
+                else:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        raise PoolError("Connection pool exhausted.")
+                    self._cond.wait(remaining)
+                    continue
+            if candidate is None:
+                connection = self.connect()
+                if connection is None:
+                    self._forget()
+                else:
+                    with self._cond:
+                        self._open.add(connection)
+                return connection
+            connection, returned_at = candidate
+            if self._healthy(connection, time.monotonic() - returned_at):
+                return connection
+            self._close(connection)
+            self._forget()
+
+    def putconn(self, connection, close=False):
+        """Returns a connection to the pool, resetting any open transaction."""
+        if connection is None:
+            return
+        self._check_fork()
+        if connection in self._inherited:
+            # Checked out by the parent before a fork: keep it alive, never close it
+            return
+        close = close or self._closed
+        if not close and not connection.closed:
+            try:
+                if connection.get_transaction_status() != extensions.TRANSACTION_STATUS_IDLE:
+                    connection.rollback()
+            except psycopg2.Error:
+                close = True
+        if close or connection.closed:
+            self._close(connection)
+            self._forget()
+            return
+        with self._cond:
+            self._idle.append((connection, time.monotonic()))
+            self._cond.notify()
+
+    def closeall(self):
+        """Closes every idle connection; checked out ones are closed when returned."""
+        self._check_fork()
+        with self._cond:
+            while self._idle:
+                connection, _ = self._idle.pop()
+                self._close(connection)
+                self._size -= 1
+            self._closed = True
+
+    def _healthy(self, connection, idle_for):
+        """Cheap liveness check, plus a SELECT 1 round trip for long idle connections."""
+        if connection.closed:
+            return False
+        if idle_for < self.ping_after:
+            return True
+        try:
+            cursor = connection.cursor()
+            cursor.execute("SELECT 1")
+            cursor.close()
+            connection.rollback()
+            return True
+        except psycopg2.Error:
+            return False
+
+    def _reap_idle(self):
+        """Closes surplus connections that have been idle longer than idle_timeout."""
+        now = time.monotonic()
+        while self._idle and self._size > self.minconn:
+            connection, returned_at = self._idle[0]
+            if now - returned_at < self.idle_timeout:
+                break
+            self._idle.popleft()
+            self._close(connection)
+            self._size -= 1
+
+    def _forget(self):
+        """Releases the slot of a connection that was closed or never opened."""
+        with self._cond:
+            self._size -= 1
+            self._cond.notify()
+
+    def _check_fork(self):
+        """
+        A forked child must not share its parent's sockets, so it starts an empty pool.
+        The inherited connections are detached rather than closed: closing (or
+        garbage collecting) one would send Terminate on the parent's session.
+        """
+        if os.getpid() != self._pid:
+            # Another parent thread may have held the lock at fork time; it is never released here
+            self._cond = threading.Condition()
+            for connection in self._open:
+                _detach_inherited(connection)
+            self._inherited |= self._open
+            self._open = set()
+            self._idle.clear()
+            self._size = 0
+            self._pid = os.getpid()
+
+    def _close(self, connection):
+        self._open.discard(connection)
+        try:
+            connection.close()
+        except psycopg2.Error:
+            pass
+
+# Inherited connections stay referenced for the life of the process, so they are never finalized
+_inherited_connections = []
+
+def _detach_inherited(connection):
+    """
+    Cuts a forked child's copy of an inherited connection off from the parent's socket.
+    The pool keeps referencing it, and its descriptor is pointed at /dev/null, so
+    even if libpq finishes it in this process (e.g. at interpreter exit) nothing
+    reaches the server.
+    """
+    _inherited_connections.append(connection)
+    try:
+        devnull = os.open(os.devnull, os.O_RDWR)
+        try:
+            os.dup2(devnull, connection.fileno())
+        finally:
+            os.close(devnull)
+    except (psycopg2.Error, OSError):
+        pass
+
+_pool = None
+_pool_lock = threading.Lock()
+
+def get_pool():
+    """Returns the shared connection pool, creating it on first use."""
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = ConnectionPool()
+        return _pool
+
+def configure_pool(**kwargs):
+    """Replaces the shared pool with one built from ConnectionPool keyword arguments."""
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.closeall()
+        _pool = ConnectionPool(**kwargs)
+        return _pool
+
+def close_pool():
+    """Closes the shared pool's idle connections."""
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.closeall()
+            _pool = None
+
+atexit.register(close_pool)
+
+def _reset_pool_after_fork():
+    global _pool_lock
+    _pool_lock = threading.Lock()
+    if _pool is not None:
+        _pool._check_fork()
+
+# Detach the parent's connections as soon as a child is forked (multiprocessing
+# workers of partitioned_scan and export), before any of them can be collected
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_reset_pool_after_fork)
+
+@contextmanager
+def pooled_connection():
+    """
+    Context manager that checks a connection out of the shared pool
+    and returns it (with any open transaction rolled back) on exit.
+    Yields None if no connection could be established.
+    """
+    pool = get_pool()
+    connection = instrumentation.timed('connection_wait_seconds', pool.getconn,
+                                       backend='postgres')
+    try:
+        yield connection
+    finally:
+        pool.putconn(connection)
+
 def create_table(connection):
-    """Creates a table user_data if it does not exist with the required fields."""
+    """
+    Creates a table user_data if it does not exist with the required fields.
+    Tables created before user_id became UUID can be upgraded with schema.migrate.
+    """
     cursor = connection.cursor()
     table_query = """
     CREATE TABLE IF NOT EXISTS user_data (
-        user_id VARCHAR(36) PRIMARY KEY,
+        user_id UUID PRIMARY KEY,
         name VARCHAR(255) NOT NULL,
         email VARCHAR(255) NOT NULL,
         age NUMERIC(5, 2) NOT NULL
@@ -91,8 +361,16 @@ def create_table(connection):
     finally:
         cursor.close()
 
-def insert_data(connection, csv_file):
-    """Inserts data into the database from a CSV file if it does not exist."""
+def insert_data(connection, csv_file, bulk=False, incremental=False):
+    """
+    Inserts data into the database from a CSV file if it does not exist.
+    With bulk=True the file is streamed through COPY instead of one INSERT per row.
+    With incremental=True an already populated table is synced with the file
+    instead of being skipped (see sync_data).
+    """
+    if incremental:
+        return sync_data(connection, csv_file)
+
     cursor = connection.cursor()
     
     # Check if the table is empty
@@ -102,16 +380,17 @@ def insert_data(connection, csv_file):
         cursor.close()
         return
 
+    if bulk:
+        cursor.close()
+        bulk_insert_data(connection, csv_file)
+        return
+
     try:
         with open(csv_file, 'r', newline='') as file:
             reader = csv.DictReader(file)
             for row in reader:
-                user_id = row.get('user_id')
-                try:
-                    # Validate if it's a UUID, otherwise generate a new one
-                    uuid.UUID(user_id)
-                except (ValueError, TypeError):
-                    user_id = str(uuid.uuid4())
+                # Validate if it's a UUID, otherwise generate a new one
+                user_id = repair_user_id(row.get('user_id'))
 
                 # Use ON CONFLICT DO NOTHING for PostgreSQL to handle duplicates
                 sql = "INSERT INTO user_data (user_id, name, email, age) VALUES (%s, %s, %s, %s) ON CONFLICT (user_id) DO NOTHING"
@@ -134,6 +413,315 @@ def insert_data(connection, csv_file):
     finally:
         cursor.close()
 
+def server_cursor(connection, prefix, itersize=2000, cursor_factory=None):
+    """
+    Opens a server-side (named) cursor on `connection`.
+    Rows stay on the server and are transferred `itersize` at a time,
+    so scans run in constant client memory.
+    """
+    name = f"{prefix}_{uuid.uuid4().hex}"
+    cursor = connection.cursor(name=name, cursor_factory=cursor_factory)
+    cursor.itersize = itersize
+    return cursor
+
+# Namespace for deterministic replacement user_ids (see repair_user_id)
+USER_ID_NAMESPACE = uuid.UUID('6f1c1a52-3b0e-4d8e-9a59-5e3c3f0b7d21')
+
+def repair_user_id(user_id, stable_name=None):
+    """
+    Returns user_id if it is a valid UUID, otherwise a replacement.
+    The replacement is random, or derived from `stable_name` when one is given,
+    so that re-reading the same row always yields the same id.
+    """
+    try:
+        uuid.UUID(user_id)
+        return user_id
+    except (ValueError, TypeError):
+        if stable_name is not None:
+            return str(uuid.uuid5(USER_ID_NAMESPACE, stable_name))
+        return str(uuid.uuid4())
+
+def _copy_lines(rows):
+    """Generator that turns (user_id, name, email, age) tuples into COPY-ready CSV lines."""
+    buffer = _LineBuffer()
+    writer = csv.writer(buffer, lineterminator='\n')
+    for row in rows:
+        writer.writerow(row)
+        yield buffer.pop()
+
+class _LineBuffer:
+    """Minimal write target for csv.writer that hands back the last written line."""
+
+    def __init__(self):
+        self.line = ''
+
+    def write(self, text):
+        self.line += text
+
+    def pop(self):
+        line, self.line = self.line, ''
+        return line
+
+class CopyStream:
+    """
+    Read-only file-like object over an iterator of text lines.
+    Lets cursor.copy_expert pull rows on demand, so the CSV is never held in memory.
+    """
+
+    def __init__(self, lines):
+        self.lines = iter(lines)
+        self.pending = ''
+        self.rows = 0
+
+    def read(self, size=-1):
+        while size < 0 or len(self.pending) < size:
+            try:
+                self.pending += next(self.lines)
+                self.rows += 1
+            except StopIteration:
+                break
+        if size < 0:
+            chunk, self.pending = self.pending, ''
+        else:
+            chunk, self.pending = self.pending[:size], self.pending[size:]
+        return chunk
+
+
+def copy_merge(cursor, rows, staging_table='user_data_staging'):
+    """
+    Streams (user_id, name, email, age) tuples through COPY into a temporary
+    staging table and merges them into user_data, skipping existing user_ids.
+    Does not commit. Returns (rows streamed, rows inserted).
+    """
+    cursor.execute(
+        f"CREATE TEMP TABLE {staging_table} "
+        f"(LIKE user_data INCLUDING DEFAULTS) ON COMMIT DROP"
+    )
+    stream = CopyStream(_copy_lines(rows))
+    cursor.copy_expert(
+        f"COPY {staging_table} (user_id, name, email, age) FROM STDIN WITH (FORMAT csv)",
+        stream
+    )
+    # DISTINCT ON keeps duplicate user_ids inside the file from aborting the merge
+    cursor.execute(
+        f"INSERT INTO user_data (user_id, name, email, age) "
+        f"SELECT DISTINCT ON (user_id) user_id, name, email, age FROM {staging_table} "
+        f"ORDER BY user_id ON CONFLICT (user_id) DO NOTHING"
+    )
+    return stream.rows, cursor.rowcount
+
+def bulk_insert_data(connection, csv_file, staging_table='user_data_staging',
+                     workers=1, reject_file=None):
+    """
+    Bulk loads the CSV file with COPY FROM STDIN into a temporary staging table,
+    then merges it into user_data with a single INSERT ... ON CONFLICT DO NOTHING.
+    Rows are validated by csv_ingest, in `workers` processes when workers > 1;
+    malformed rows are skipped and written to `reject_file` if one is given.
+    Returns the number of rows merged into user_data.
+    """
+    cursor = connection.cursor()
+    start = time.perf_counter()
+    try:
+        rows = csv_ingest.iter_validated_rows(csv_file, workers=workers,
+                                              reject_file=reject_file)
+        loaded, inserted = copy_merge(cursor, rows, staging_table)
+        connection.commit()
+        elapsed = time.perf_counter() - start
+        rate = loaded / elapsed if elapsed > 0 else float('inf')
+        print(f"Bulk loaded {loaded} rows ({inserted} new) in {elapsed:.2f}s "
+              f"({rate:,.0f} rows/sec).")
+        return inserted
+    except FileNotFoundError:
+        print(f"Error: CSV file '{csv_file}' not found.")
+        connection.rollback()
+        return 0
+    except (psycopg2.Error, ValueError) as err:
+        print(f"Failed bulk loading data: {err}")
+        connection.rollback()
+        return 0
+    finally:
+        cursor.close()
+
+SYNC_SEEN_TABLE = 'user_data_sync_seen'
+
+_CENTS = Decimal('0.01')
+
+def round_age(age):
+    """
+    Rounds an age (str, float or Decimal) to 2 decimals half away from zero,
+    as PostgreSQL's round(numeric, 2) does. Formatting the binary float instead
+    would round 12.345 down on this side and up on the server.
+    Raises decimal.InvalidOperation if age is not a number.
+    """
+    return Decimal(str(age).strip()).quantize(_CENTS, rounding=ROUND_HALF_UP)
+
+def row_hash(name, email, age):
+    """
+    Content hash of a user row. Matches the SQL expression used by sync_data:
+    md5(name || '|' || email || '|' || round(age::numeric, 2)::text)
+    """
+    return hashlib.md5(f"{name}|{email}|{round_age(age)}".encode('utf-8')).hexdigest()
+
+def _load_checkpoint(path, fingerprint):
+    """Returns the saved checkpoint for this exact file version, or None."""
+    try:
+        with open(path, 'r') as file:
+            checkpoint = json.load(file)
+    except (FileNotFoundError, ValueError):
+        return None
+    if checkpoint.get('file') != fingerprint:
+        print(f"Ignoring checkpoint {path}: the CSV file has changed since it was written.")
+        return None
+    return checkpoint
+
+def _save_checkpoint(path, checkpoint):
+    """Writes the checkpoint atomically so a crash never leaves a torn file."""
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'w') as file:
+        json.dump(checkpoint, file)
+    os.replace(tmp_path, path)
+
+def _prepare_seen_table(cursor, fresh):
+    """Creates the table recording which user_ids the current sync has seen."""
+    cursor.execute("SELECT to_regclass(%s)", (SYNC_SEEN_TABLE,))
+    if cursor.fetchone()[0] is None:
+        # Copy the user_id type from user_data so the final anti-join stays indexable
+        cursor.execute(f"CREATE UNLOGGED TABLE {SYNC_SEEN_TABLE} AS "
+                       f"SELECT user_id FROM user_data WITH NO DATA")
+        cursor.execute(f"ALTER TABLE {SYNC_SEEN_TABLE} ADD PRIMARY KEY (user_id)")
+    elif fresh:
+        cursor.execute(f"TRUNCATE {SYNC_SEEN_TABLE}")
+
+def _sync_chunk(cursor, chunk, stats, track_seen):
+    """Upserts the new and changed rows of one chunk and records the ids seen."""
+    latest = {}
+    for user_id, name, email, age, digest in chunk:
+        latest[user_id] = (name, email, age, digest)
+
+    cursor.execute(
+        "SELECT user_id, md5(name || '|' || email || '|' || round(age::numeric, 2)::text) "
+        "FROM user_data WHERE user_id IN %s",
+        (tuple(latest),)
+    )
+    existing = {str(user_id): digest for user_id, digest in cursor.fetchall()}
+
+    changed = []
+    for user_id, (name, email, age, digest) in latest.items():
+        current = existing.get(user_id)
+        if current is None:
+            stats['inserted'] += 1
+        elif current != digest:
+            stats['updated'] += 1
+        else:
+            stats['unchanged'] += 1
+            continue
+        changed.append((user_id, name, email, age))
+
+    if changed:
+        execute_values(
+            cursor,
+            "INSERT INTO user_data (user_id, name, email, age) VALUES %s "
+            "ON CONFLICT (user_id) DO UPDATE SET name = EXCLUDED.name, "
+            "email = EXCLUDED.email, age = EXCLUDED.age",
+            changed
+        )
+    if track_seen:
+        execute_values(
+            cursor,
+            f"INSERT INTO {SYNC_SEEN_TABLE} (user_id) VALUES %s ON CONFLICT DO NOTHING",
+            [(user_id,) for user_id in latest]
+        )
+
+def sync_data(connection, csv_file, batch_size=1000, checkpoint_file=None, delete_missing=True):
+    """
+    Incrementally syncs user_data with a CSV file.
+
+    Rows are hashed and compared with the table a batch at a time: new rows are
+    inserted, changed rows updated, unchanged rows skipped, and (with
+    delete_missing) rows absent from the file are deleted at the end. Every
+    batch is committed together with the list of seen user_ids, and progress is
+    saved to a JSON checkpoint, so a crashed sync of a huge file resumes from the
+    last committed batch. Invalid user_ids are replaced with ids derived from
+    the row's name and email, so they stay stable across runs.
+
+    Returns a dict of counts (inserted, updated, unchanged, deleted, rejected).
+    """
+    checkpoint_file = checkpoint_file or f"{csv_file}.sync.json"
+    try:
+        info = os.stat(csv_file)
+    except FileNotFoundError:
+        print(f"Error: CSV file '{csv_file}' not found.")
+        return None
+    fingerprint = {'path': os.path.abspath(csv_file), 'size': info.st_size,
+                   'mtime': info.st_mtime}
+    checkpoint = _load_checkpoint(checkpoint_file, fingerprint)
+    if checkpoint:
+        rows_done, stats = checkpoint['rows'], checkpoint['stats']
+        print(f"Resuming sync of {csv_file} after row {rows_done}.")
+    else:
+        rows_done = 0
+        stats = {'inserted': 0, 'updated': 0, 'unchanged': 0, 'deleted': 0, 'rejected': 0}
+
+    cursor = connection.cursor()
+    try:
+        if delete_missing:
+            _prepare_seen_table(cursor, fresh=checkpoint is None)
+            connection.commit()
+
+        with open(csv_file, 'r', newline='') as file:
+            reader = csv.DictReader(file)
+            rows_read = 0
+            chunk = []
+            for row in reader:
+                rows_read += 1
+                if rows_read <= rows_done:
+                    continue
+                try:
+                    # Same checks as the bulk loader; the age comes back rounded to
+                    # cents, so the stored age is exactly the value hashed
+                    user_id, name, email, age = csv_ingest.normalize_row(row)
+                except ValueError as err:
+                    print(f"Skipping malformed row {rows_read} ({err}): {row}")
+                    stats['rejected'] += 1
+                    continue
+                # The server returns UUIDs in canonical lower-case form; match that
+                user_id = str(uuid.UUID(user_id))
+                chunk.append((user_id, name, email, age, row_hash(name, email, age)))
+                if len(chunk) >= batch_size:
+                    _sync_chunk(cursor, chunk, stats, delete_missing)
+                    connection.commit()
+                    chunk = []
+                    _save_checkpoint(checkpoint_file, {'file': fingerprint, 'rows': rows_read,
+                                                       'stats': stats})
+            if chunk:
+                _sync_chunk(cursor, chunk, stats, delete_missing)
+                connection.commit()
+                _save_checkpoint(checkpoint_file, {'file': fingerprint, 'rows': rows_read,
+                                                   'stats': stats})
+
+        if delete_missing:
+            cursor.execute(
+                f"DELETE FROM user_data u WHERE NOT EXISTS "
+                f"(SELECT 1 FROM {SYNC_SEEN_TABLE} s WHERE s.user_id = u.user_id)"
+            )
+            stats['deleted'] = cursor.rowcount
+            # The seen table is only cleared when the next sync starts, so repeating
+            # this DELETE after a crash right here is harmless
+            connection.commit()
+
+        if os.path.exists(checkpoint_file):
+            os.remove(checkpoint_file)
+        print(f"Sync complete: {stats['inserted']} inserted, {stats['updated']} updated, "
+              f"{stats['unchanged']} unchanged, {stats['deleted']} deleted, "
+              f"{stats['rejected']} rejected.")
+        return stats
+    except psycopg2.Error as err:
+        print(f"Failed syncing data: {err}")
+        connection.rollback() # The checkpoint still points at the last committed batch
+        return None
+    finally:
+        cursor.close()
+
 if __name__ == '__main__':
     # This block is for testing individual functions or for setting up
     pass
@@ -0,0 +1,274 @@
+#!/usr/bin/python3
+"""
+Deterministic synthetic user_data for load tests and benchmarks.
+
+Rows are generated in fixed-size chunks. Chunk i is drawn from its own random
+generator seeded with (seed, i), so the output depends only on the seed and
+the chunk size, never on the number of worker processes, and chunks can be
+produced in parallel. With NumPy installed each chunk is drawn vectorized;
+without it a pure-Python generator with the same distributions is used (the
+two engines produce different, but each deterministic, rows).
+
+Names and email domains follow skewed (Zipf-like) popularity, a few names
+carry a generational suffix, email local parts come in the usual styles with
+the row number appended so every email is unique, and ages follow a normal
+distribution around 42, clipped to 18..100.
+
+Usage:
+    ./synthetic.py --rows 10000000 --csv users.csv --workers 8
+    ./synthetic.py --rows 1000000 --sqlite users.db
+    ./synthetic.py --rows 1000000 --postgres        # COPY into the .env database
+"""
+
+import argparse
+import itertools
+import os
+import random
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+FIRST_NAMES = (
+    'James', 'Mary', 'Robert', 'Patricia', 'John', 'Jennifer', 'Michael', 'Linda', 'David',
+    'Elizabeth', 'William', 'Barbara', 'Richard', 'Susan', 'Joseph', 'Jessica', 'Thomas',
+    'Sarah', 'Daniel', 'Karen', 'Molly', 'Glenda', 'Ronnie', 'Alma', 'Jonathon', 'Forrest',
+    'Dan', 'Miriam', 'Delia', 'Sandra', 'Shelly', 'Jody', 'Albert', 'Nadia', 'Kenji', 'Amara',
+    'Luis', 'Priya', 'Chen', 'Fatima',
+)
+LAST_NAMES = (
+    'Smith', 'Johnson', 'Williams', 'Brown', 'Jones', 'Garcia', 'Miller', 'Davis', 'Rodriguez',
+    'Martinez', 'Hernandez', 'Lopez', 'Wilson', 'Anderson', 'Taylor', 'Moore', 'Altenwerth',
+    'Wisozk', 'Fahey', 'Bechtelar', 'Heaney', 'Quigley', 'Lesch', 'Balistreri', 'Ziemann',
+    'Okafor', 'Nakamura', 'Patel', 'Kowalski', 'Nguyen',
+)
+SUFFIXES = ('', ' Jr.', ' Sr.', ' II', ' III', ' IV')
+SUFFIX_WEIGHTS = (0.94, 0.025, 0.015, 0.01, 0.006, 0.004)
+DOMAINS = ('gmail.com', 'yahoo.com', 'hotmail.com', 'outlook.com', 'icloud.com', 'aol.com',
+           'proton.me', 'example.org')
+DOMAIN_WEIGHTS = (0.42, 0.18, 0.14, 0.1, 0.07, 0.04, 0.03, 0.02)
+AGE_MEAN, AGE_STDDEV, AGE_MIN, AGE_MAX = 42.0, 17.0, 18, 100
+
+DEFAULT_CHUNK_SIZE = 100_000
+
+def _zipf_weights(count, exponent=0.8):
+    weights = [1 / (rank + 1) ** exponent for rank in range(count)]
+    total = sum(weights)
+    return tuple(weight / total for weight in weights)
+
+FIRST_WEIGHTS = _zipf_weights(len(FIRST_NAMES))
+LAST_WEIGHTS = _zipf_weights(len(LAST_NAMES))
+
+def _format_uuid(hex32):
+    return f"{hex32[:8]}-{hex32[8:12]}-{hex32[12:16]}-{hex32[16:20]}-{hex32[20:]}"
+
+def _email(first, last, style, number, domain):
+    if style == 0:
+        local = f"{first}{number}"
+    elif style == 1:
+        local = f"{first}.{last}{number}"
+    else:
+        local = f"{first}_{last}{number}"
+    return f"{local}@{domain}"
+
+def _numpy_chunk(seed, index, start, count):
+    import numpy as np
+    rng = np.random.default_rng([seed, index])
+    first = rng.choice(len(FIRST_NAMES), size=count, p=FIRST_WEIGHTS)
+    last = rng.choice(len(LAST_NAMES), size=count, p=LAST_WEIGHTS)
+    suffix = rng.choice(len(SUFFIXES), size=count, p=SUFFIX_WEIGHTS)
+    mail_first = rng.choice(len(FIRST_NAMES), size=count, p=FIRST_WEIGHTS)
+    style = rng.integers(0, 3, size=count)
+    domain = rng.choice(len(DOMAINS), size=count, p=DOMAIN_WEIGHTS)
+    ages = np.clip(np.rint(rng.normal(AGE_MEAN, AGE_STDDEV, size=count)), AGE_MIN, AGE_MAX)
+    ids = rng.integers(0, 256, size=(count, 16), dtype=np.uint8)
+    ids[:, 6] = (ids[:, 6] & 0x0F) | 0x40 # version 4
+    ids[:, 8] = (ids[:, 8] & 0x3F) | 0x80 # RFC 4122 variant
+    hexes = ids.tobytes().hex()
+    return [
+        (
+            _format_uuid(hexes[i * 32:i * 32 + 32]),
+            f"{FIRST_NAMES[f]} {LAST_NAMES[l]}{SUFFIXES[s]}",
+            _email(FIRST_NAMES[m], LAST_NAMES[l], y, start + i, DOMAINS[d]),
+            float(age),
+        )
+        for i, (f, l, s, m, y, d, age) in enumerate(zip(
+            first.tolist(), last.tolist(), suffix.tolist(), mail_first.tolist(),
+            style.tolist(), domain.tolist(), ages.tolist()))
+    ]
+
+def _python_chunk(seed, index, start, count):
+    rng = random.Random(f"{seed}:{index}")
+    firsts = rng.choices(FIRST_NAMES, FIRST_WEIGHTS, k=count)
+    lasts = rng.choices(LAST_NAMES, LAST_WEIGHTS, k=count)
+    suffixes = rng.choices(SUFFIXES, SUFFIX_WEIGHTS, k=count)
+    mail_firsts = rng.choices(FIRST_NAMES, FIRST_WEIGHTS, k=count)
+    styles = rng.choices(range(3), k=count)
+    domains = rng.choices(DOMAINS, DOMAIN_WEIGHTS, k=count)
+    gauss = rng.gauss
+    ages = [float(min(max(round(gauss(AGE_MEAN, AGE_STDDEV)), AGE_MIN), AGE_MAX))
+            for _ in range(count)]
+    getrandbits = rng.getrandbits
+    rows = []
+    for i, (first, last, suffix, mail_first, style, domain, age) in enumerate(zip(
+            firsts, lasts, suffixes, mail_firsts, styles, domains, ages)):
+        bits = getrandbits(128)
+        bits = (bits & ~(0xF << 76)) | (0x4 << 76) # version 4
+        bits = (bits & ~(0x3 << 62)) | (0x2 << 62) # RFC 4122 variant
+        rows.append((
+            _format_uuid(f"{bits:032x}"),
+            f"{first} {last}{suffix}",
+            _email(mail_first, last, style, start + i, domain),
+            age,
+        ))
+    return rows
+
+def _has_numpy():
+    try:
+        import numpy # noqa: F401
+        return True
+    except ImportError:
+        return False
+
+def generate_chunk(seed, index, start, count, use_numpy=None):
+    """Returns the `count` rows of chunk `index`, whose first row is row number `start`."""
+    if use_numpy is None:
+        use_numpy = _has_numpy()
+    return (_numpy_chunk if use_numpy else _python_chunk)(seed, index, start, count)
+
+def _csv_chunk(seed, index, start, count, use_numpy):
+    # The name and domain pools contain no commas or quotes, so no CSV quoting is needed
+    return ''.join(f"{user_id},{name},{email},{age:g}\n"
+                   for user_id, name, email, age in generate_chunk(seed, index, start, count,
+                                                                   use_numpy))
+
+def _chunk_specs(count, chunk_size):
+    return [(index, start, min(chunk_size, count - start))
+            for index, start in enumerate(range(0, count, chunk_size))]
+
+def _run_chunks(worker, count, seed, chunk_size, workers, use_numpy):
+    """Generator of worker results for every chunk, in chunk order."""
+    if use_numpy is None:
+        use_numpy = _has_numpy()
+    specs = _chunk_specs(count, chunk_size)
+    if workers <= 1:
+        for index, start, size in specs:
+            yield worker(seed, index, start, size, use_numpy)
+        return
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        specs = iter(specs)
+        pending = []
+        # Keep a bounded number of chunks in flight so a slow consumer caps memory
+        for index, start, size in itertools.islice(specs, workers * 2):
+            pending.append(executor.submit(worker, seed, index, start, size, use_numpy))
+        try:
+            while pending:
+                result = pending.pop(0).result()
+                for index, start, size in itertools.islice(specs, 1):
+                    pending.append(executor.submit(worker, seed, index, start, size, use_numpy))
+                yield result
+        finally:
+            for future in pending:
+                future.cancel()
+
+def _rows_chunk(seed, index, start, count, use_numpy):
+    return generate_chunk(seed, index, start, count, use_numpy)
+
+def generate(count, seed=0, chunk_size=DEFAULT_CHUNK_SIZE, workers=1, use_numpy=None):
+    """
+    Generator of `count` deterministic (user_id, name, email, age) rows.
+
+    Args:
+        count (int): Number of rows.
+        seed (int): Seed; the same seed and chunk_size always give the same rows.
+        chunk_size (int): Rows drawn per chunk, the unit of parallel work.
+        workers (int): Worker processes; 1 generates in this process.
+        use_numpy (bool, optional): Force or forbid the NumPy engine (default: auto).
+    """
+    for rows in _run_chunks(_rows_chunk, count, seed, chunk_size, workers, use_numpy):
+        yield from rows
+
+def csv_chunks(count, seed=0, chunk_size=DEFAULT_CHUNK_SIZE, workers=1, use_numpy=None):
+    """Generator of CSV text, one string per chunk, without a header line."""
+    return _run_chunks(_csv_chunk, count, seed, chunk_size, workers, use_numpy)
+
+def write_csv(path, count, seed=0, chunk_size=DEFAULT_CHUNK_SIZE, workers=1):
+    """Writes `count` rows with a user_id,name,email,age header to `path`."""
+    with open(path, 'w', newline='') as file:
+        file.write('user_id,name,email,age\n')
+        for text in csv_chunks(count, seed, chunk_size, workers):
+            file.write(text)
+    return count
+
+_COPY_PIECE = 64 * 1024
+
+def _pieces(chunks):
+    # CopyStream re-slices its pending text on every read, so keep what it holds small
+    for text in chunks:
+        for offset in range(0, len(text), _COPY_PIECE):
+            yield text[offset:offset + _COPY_PIECE]
+
+def copy_stream(count, seed=0, chunk_size=DEFAULT_CHUNK_SIZE, workers=1):
+    """A file-like object of CSV rows (no header) for cursor.copy_expert."""
+    import seed as seed_module
+    return seed_module.CopyStream(_pieces(csv_chunks(count, seed, chunk_size, workers)))
+
+def load_postgres(connection, count, seed=0, chunk_size=DEFAULT_CHUNK_SIZE, workers=1):
+    """COPYs `count` rows straight into user_data and commits."""
+    cursor = connection.cursor()
+    try:
+        cursor.copy_expert("COPY user_data (user_id, name, email, age) FROM STDIN WITH (FORMAT csv)",
+                           copy_stream(count, seed, chunk_size, workers))
+        connection.commit()
+    finally:
+        cursor.close()
+    return count
+
+def load_sqlite(path, count, seed=0, chunk_size=DEFAULT_CHUNK_SIZE, workers=1):
+    """Creates user_data in the SQLite file `path` if needed and loads `count` rows."""
+    import backends
+    backend = backends.SQLiteBackend(path)
+    connection = backend.connect()
+    try:
+        backend.create_table(connection)
+        return backend.bulk_load(connection, generate(count, seed, chunk_size, workers))
+    finally:
+        connection.close()
+
+def main():
+    parser = argparse.ArgumentParser(description="Generate synthetic user_data rows.")
+    parser.add_argument('--rows', type=int, required=True)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1)
+    parser.add_argument('--chunk-size', type=int, default=DEFAULT_CHUNK_SIZE)
+    target = parser.add_mutually_exclusive_group(required=True)
+    target.add_argument('--csv', help="Write a CSV file ('-' for stdout).")
+    target.add_argument('--sqlite', help="Load into user_data in this SQLite file.")
+    target.add_argument('--postgres', action='store_true',
+                        help="COPY into user_data in the database configured in .env.")
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    if args.csv == '-':
+        sys.stdout.write('user_id,name,email,age\n')
+        for text in csv_chunks(args.rows, args.seed, args.chunk_size, args.workers):
+            sys.stdout.write(text)
+    elif args.csv:
+        write_csv(args.csv, args.rows, args.seed, args.chunk_size, args.workers)
+    elif args.sqlite:
+        load_sqlite(args.sqlite, args.rows, args.seed, args.chunk_size, args.workers)
+    else:
+        import seed
+        connection = seed.connect_to_prodev()
+        if connection is None:
+            return
+        try:
+            seed.create_table(connection)
+            load_postgres(connection, args.rows, args.seed, args.chunk_size, args.workers)
+        finally:
+            connection.close()
+    elapsed = time.perf_counter() - start
+    print(f"Generated {args.rows} rows in {elapsed:.2f}s "
+          f"({args.rows / elapsed:,.0f} rows/sec).", file=sys.stderr)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,98 @@
+#!/usr/bin/python3
+"""
+Unit tests for the in-process aggregation helpers.
+"""
+import random
+import statistics
+import unittest
+
+from aggregate import QuantileSketch, RunningStats, summarize
+
+
+class TestRunningStats(unittest.TestCase):
+    """Tests RunningStats against the statistics module."""
+
+    def test_matches_statistics(self):
+        """Count, sum, mean, min, max and stddev agree with a two-pass computation."""
+        rng = random.Random(1)
+        values = [rng.uniform(0, 120) for _ in range(1000)]
+        stats = RunningStats()
+        for value in values:
+            stats.update(value)
+        self.assertEqual(stats.count, len(values))
+        self.assertAlmostEqual(stats.total, sum(values))
+        self.assertAlmostEqual(stats.mean, statistics.mean(values))
+        self.assertEqual((stats.min, stats.max), (min(values), max(values)))
+        self.assertAlmostEqual(stats.stddev, statistics.stdev(values))
+
+    def test_stddev_needs_two_values(self):
+        """stddev is None below two values, like SQL's stddev_samp."""
+        stats = RunningStats()
+        stats.update(5.0)
+        self.assertIsNone(stats.stddev)
+
+
+class TestQuantileSketch(unittest.TestCase):
+    """Tests the accuracy and bounds of the KLL sketch."""
+
+    def _rank_error(self, values, q, estimate):
+        rank = sum(1 for value in values if value <= estimate) / len(values)
+        return abs(rank - q)
+
+    def test_small_input_is_exact(self):
+        """Below the first compaction the sketch holds every value."""
+        sketch = QuantileSketch(k=200, seed=0)
+        for value in range(1, 101):
+            sketch.update(value)
+        self.assertEqual(sketch.quantile(0.5), 50)
+        self.assertEqual(sketch.quantile(0), 1)
+        self.assertEqual(sketch.quantile(1), 100)
+
+    def test_rank_error_on_large_stream(self):
+        """Quantiles of a long shuffled stream are within a few 1/k of the true rank."""
+        values = list(range(100000))
+        random.Random(2).shuffle(values)
+        sketch = QuantileSketch(k=200, seed=3)
+        for value in values:
+            sketch.update(value)
+        for q in (0.01, 0.25, 0.5, 0.9, 0.99):
+            with self.subTest(q=q):
+                self.assertLess(self._rank_error(values, q, sketch.quantile(q)), 0.02)
+
+    def test_memory_is_bounded(self):
+        """The sketch keeps O(k) items however long the stream is."""
+        sketch = QuantileSketch(k=100, seed=4)
+        for value in range(50000):
+            sketch.update(value)
+        self.assertEqual(sketch.count, 50000)
+        self.assertLess(sum(len(items) for items in sketch._levels), 400)
+
+    def test_empty_and_invalid(self):
+        """An empty sketch has no quantiles; q outside [0, 1] is rejected."""
+        sketch = QuantileSketch()
+        self.assertIsNone(sketch.quantile(0.5))
+        with self.assertRaises(ValueError):
+            sketch.quantile(1.5)
+
+
+class TestSummarize(unittest.TestCase):
+    """Tests summarize."""
+
+    def test_summary(self):
+        """summarize combines the running stats with the requested percentiles."""
+        summary = summarize(['10', 20, 30.0], percentiles=(0.5,))
+        self.assertEqual(summary['count'], 3)
+        self.assertEqual(summary['sum'], 60.0)
+        self.assertEqual(summary['mean'], 20.0)
+        self.assertEqual(summary['percentiles'], {0.5: 20.0})
+
+    def test_empty_input(self):
+        """An empty input has a count of zero and no mean or percentiles."""
+        summary = summarize([], percentiles=(0.5,))
+        self.assertEqual(summary['count'], 0)
+        self.assertIsNone(summary['mean'])
+        self.assertEqual(summary['percentiles'], {0.5: None})
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,81 @@
+#!/usr/bin/python3
+"""
+Unit tests for the spill-to-disk sort and dedupe stages.
+"""
+import os
+import random
+import tempfile
+import unittest
+from operator import itemgetter
+from unittest.mock import patch
+
+import external_sort
+from external_sort import external_dedupe, external_sort as sort_items
+
+
+class TestExternalSort(unittest.TestCase):
+    """Tests external_sort in memory, with spilled runs and with multi-pass merges."""
+
+    def setUp(self):
+        self._tmpdir = tempfile.TemporaryDirectory()
+        self.tmpdir = self._tmpdir.name
+        rng = random.Random(5)
+        self.rows = [{'id': i, 'age': rng.randint(0, 99)} for i in range(5000)]
+
+    def tearDown(self):
+        self._tmpdir.cleanup()
+
+    def test_fits_in_memory(self):
+        """Input under the budget is sorted without creating run files."""
+        result = list(sort_items(self.rows, key=itemgetter('age'), tmpdir=self.tmpdir))
+        self.assertEqual(result, sorted(self.rows, key=itemgetter('age')))
+        self.assertEqual(os.listdir(self.tmpdir), [])
+
+    def test_spilled_runs_merge_stably(self):
+        """Spilled runs merge into the same order as a stable in-memory sort."""
+        result = list(sort_items(self.rows, key=itemgetter('age'), memory_budget=20000,
+                                 tmpdir=self.tmpdir))
+        self.assertEqual(result, sorted(self.rows, key=itemgetter('age')))
+        self.assertEqual(os.listdir(self.tmpdir), [])
+
+    def test_reverse(self):
+        """reverse=True sorts in descending order, as sorted() does."""
+        result = list(sort_items(self.rows, key=itemgetter('age'), reverse=True,
+                                 memory_budget=20000, tmpdir=self.tmpdir))
+        self.assertEqual(result, sorted(self.rows, key=itemgetter('age'), reverse=True))
+
+    def test_multi_pass_merge(self):
+        """More runs than MAX_FAN_IN are merged in passes and the run files removed."""
+        with patch.object(external_sort, 'MAX_FAN_IN', 3):
+            result = list(sort_items(self.rows, key=itemgetter('age'), memory_budget=5000,
+                                     tmpdir=self.tmpdir))
+        self.assertEqual(result, sorted(self.rows, key=itemgetter('age')))
+        self.assertEqual(os.listdir(self.tmpdir), [])
+
+    def test_closing_early_removes_runs(self):
+        """Run files are removed when the consumer stops before the end."""
+        items = sort_items(self.rows, key=itemgetter('age'), memory_budget=20000,
+                           tmpdir=self.tmpdir)
+        next(items)
+        self.assertNotEqual(os.listdir(self.tmpdir), [])
+        items.close()
+        self.assertEqual(os.listdir(self.tmpdir), [])
+
+
+class TestExternalDedupe(unittest.TestCase):
+    """Tests external_dedupe."""
+
+    def test_keeps_first_occurrence_in_key_order(self):
+        """One item per key is kept, the first seen in the input, in key order."""
+        rows = [{'email': f"user{i % 50}@example.com", 'seen': i} for i in range(1000)]
+        with tempfile.TemporaryDirectory() as tmpdir:
+            result = list(external_dedupe(rows, key=itemgetter('email'), memory_budget=5000,
+                                          tmpdir=tmpdir))
+        expected = sorted({row['email']: row for row in reversed(rows)}.values(),
+                          key=itemgetter('email'))
+        self.assertEqual(result, expected)
+        self.assertTrue(all(row['seen'] < 50 for row in result))
+
+
+if __name__ == '__main__':
+    unittest.main()
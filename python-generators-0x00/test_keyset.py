@@ -0,0 +1,50 @@
+#!/usr/bin/python3
+"""
+Unit tests for the keyset resume tokens.
+"""
+import unittest
+
+from keyset import decode_token, encode_token, key_columns
+
+
+class TestResumeToken(unittest.TestCase):
+    """Tests encode_token and decode_token."""
+
+    def test_round_trip_on_user_id(self):
+        """A token for the user_id key decodes to the values it was given."""
+        after = ('0b7f4c2e-6c2d-4a0e-9d6a-1f0e0d6c9b11',)
+        self.assertEqual(decode_token(encode_token('user_id', after), 'user_id'), after)
+
+    def test_round_trip_with_tiebreaker(self):
+        """A token for a non-unique key carries the user_id tiebreaker too."""
+        after = (42.5, '0b7f4c2e-6c2d-4a0e-9d6a-1f0e0d6c9b11')
+        self.assertEqual(len(key_columns('age')), 2)
+        self.assertEqual(decode_token(encode_token('age', after), 'age'), after)
+
+    def test_token_is_url_safe(self):
+        """Tokens only use characters that need no escaping in a URL."""
+        token = encode_token('name', ('?&/+ émile', 'x' * 40))
+        self.assertRegex(token, r'^[A-Za-z0-9_=-]+$')
+
+    def test_token_for_another_key_is_rejected(self):
+        """A token issued for one key cannot resume a scan on another."""
+        token = encode_token('age', (30, 'abc'))
+        with self.assertRaises(ValueError):
+            decode_token(token, 'name')
+
+    def test_wrong_number_of_values_is_rejected(self):
+        """A token must hold one value per key column."""
+        token = encode_token('age', (30,))
+        with self.assertRaises(ValueError):
+            decode_token(token, 'age')
+
+    def test_malformed_tokens_are_rejected(self):
+        """Garbage and tampered tokens raise ValueError, not a decoding error."""
+        for token in ('not a token', encode_token('user_id', ('a',))[:-4], 'W10=', 'é'):
+            with self.subTest(token=token):
+                with self.assertRaises(ValueError):
+                    decode_token(token, 'user_id')
+
+
+if __name__ == '__main__':
+    unittest.main()